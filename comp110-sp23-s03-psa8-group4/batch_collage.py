@@ -0,0 +1,234 @@
+"""
+Module: batch_collage
+
+Non-interactive version of collage_creator for making collages of many
+pictures at once.
+
+Example:
+    python batch_collage.py photos/ "scans/*.jpg" -o collages -W 900 -H 600 -j 4
+
+Each input may be a directory (every image file in it is used) or a glob
+pattern. The collages are saved in the output directory as
+<name>_collage.<format> (or <name>_<extension>_collage.<format> when
+pictures only differ in their extension), and the time taken for each file
+is printed as it finishes. Pictures with the same name and extension in
+different directories are turned away, since their collages would
+overwrite each other.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import argparse
+import collections
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+import collage_creator
+import comp110_image
+import image_cache
+import resample
+
+
+def is_image_file(filename):
+    """
+    Returns whether filename has the extension of a format PIL can open, or
+    is a raw picture (see comp110_image.open_raw).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return extension == comp110_image.RAW_EXTENSION \
+            or extension in Image.registered_extensions()
+
+
+def find_images(inputs):
+    """
+    Returns a sorted list of the files named by inputs, with duplicates
+    removed. Only image files (see is_image_file) are taken from
+    directories; glob patterns are used as they are.
+
+    Parameters:
+    inputs (type: list of str) - Directories and/or glob patterns.
+
+    Returns:
+    (type: list of str) - The matching file names.
+    """
+    filenames = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            filenames.update(f for f in glob.glob(os.path.join(pattern, "*"))
+                    if os.path.isfile(f) and is_image_file(f))
+        else:
+            filenames.update(f for f in glob.glob(pattern) if os.path.isfile(f))
+
+    return sorted(filenames)
+
+
+def output_filename(image_filename, output_dir, extension,
+        keep_extension=False):
+    """
+    Returns where the collage of image_filename is saved. If keep_extension
+    is True, the picture's own extension is kept in the name (e.g.
+    x_jpg_collage.png for x.jpg).
+    """
+    name, source_extension = os.path.splitext(os.path.basename(image_filename))
+    if keep_extension and source_extension:
+        name += "_" + source_extension[1:]
+    return os.path.join(output_dir, "%s_collage.%s" % (name, extension))
+
+
+def output_filenames(filenames, output_dir, extension):
+    """
+    Returns a dict of where the collage of each picture in filenames is
+    saved (see output_filename). Pictures whose names only differ in their
+    extension keep it, so their collages don't overwrite each other.
+
+    Raises a ValueError if two pictures would still be saved to the same
+    file (e.g. a/x.jpg and b/x.jpg).
+    """
+    plain = collections.Counter(output_filename(f, output_dir, extension)
+            for f in filenames)
+    outputs = {}
+    for f in filenames:
+        output = output_filename(f, output_dir, extension)
+        if plain[output] > 1:
+            output = output_filename(f, output_dir, extension, True)
+        outputs[f] = output
+
+    clashes = collections.defaultdict(list)
+    for f, output in outputs.items():
+        clashes[output].append(f)
+    for output, sources in sorted(clashes.items()):
+        if len(sources) > 1:
+            raise ValueError("%s would all be saved as %s"
+                    % (", ".join(sources), output))
+    return outputs
+
+
+def make_collage(image_filename, collage_filename, max_w, max_h, backend=None,
+        cache_dir=None, cache_bytes=image_cache.DEFAULT_MAX_BYTES):
+    """
+    Creates and saves the collage of one picture, without showing it.
+
+    Parameters:
+    image_filename (type: str) - The picture to make a collage of.
+    collage_filename (type: str) - Where to save the collage.
+    max_w (type: int) - The maximum width of the collage.
+    max_h (type: int) - The maximum height of the collage.
+    backend (type: str) - "python" or "numpy" (see filter_engine).
+    cache_dir (type: str) - Directory of an image_cache.ImageCache to reuse
+        shrunk and filtered pictures from, or None for no cache.
+    cache_bytes (type: int) - Size limit of the cache.
+
+    Returns:
+    (type: dict) - Seconds spent loading, making and saving the collage.
+    """
+    # both ways load the picture with resample.load_fit, so the collage is
+    # the same with or without a cache
+    start = time.perf_counter()
+    if cache_dir is None:
+        pic = resample.load_fit(image_filename, max_w // 3, max_h // 2)
+        loaded = time.perf_counter()
+        collage = collage_creator.create_collage(pic, max_w, max_h, backend)
+    else:
+        cache = image_cache.ImageCache(cache_dir, cache_bytes)
+        pic = cache.load_fit(image_filename, max_w // 3, max_h // 2)
+        loaded = time.perf_counter()
+        collage = image_cache.create_collage(image_filename, max_w, max_h,
+                cache, backend, pic)
+    created = time.perf_counter()
+    collage.save(collage_filename)
+    saved = time.perf_counter()
+
+    return {"load": loaded - start, "collage": created - loaded,
+            "save": saved - created, "total": saved - start}
+
+
+def parse_args(argv=None):
+    """Returns the parsed command line arguments."""
+    parser = argparse.ArgumentParser(
+            description="Create Andy Warhol-style collages of many pictures.")
+    parser.add_argument("inputs", nargs="+",
+            help="directories and/or glob patterns of pictures")
+    parser.add_argument("-o", "--output-dir", required=True,
+            help="directory to save the collages in")
+    parser.add_argument("-W", "--max-width", type=int, required=True,
+            help="maximum width of each collage (at least 3)")
+    parser.add_argument("-H", "--max-height", type=int, required=True,
+            help="maximum height of each collage (at least 2)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+            help="number of pictures to work on at the same time")
+    parser.add_argument("-f", "--format", default="png",
+            help="file format (extension) of the collages (default: png)")
+    parser.add_argument("--backend", choices=("python", "numpy"),
+            help="filter backend (default: numpy if installed)")
+    parser.add_argument("--cache-dir",
+            help="directory to cache shrunk and filtered pictures in")
+    parser.add_argument("--cache-mb", type=int,
+            default=image_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+            help="size limit of the cache in megabytes (default: 1024)")
+
+    args = parser.parse_args(argv)
+    if args.max_width < 3:
+        parser.error("--max-width must be at least 3")
+    if args.max_height < 2:
+        parser.error("--max-height must be at least 2")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def main(argv=None):
+    """
+    Runs the batch collage program.
+
+    Returns:
+    (type: int) - The exit status: 0 if every collage was made, 1 otherwise.
+    """
+    args = parse_args(argv)
+    filenames = find_images(args.inputs)
+    if not filenames:
+        print("No pictures found.", file=sys.stderr)
+        return 1
+
+    try:
+        outputs = output_filenames(filenames, args.output_dir, args.format)
+    except ValueError as e:
+        print("Can't make the collages: %s." % e, file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = {pool.submit(make_collage, f, outputs[f],
+                args.max_width, args.max_height, args.backend, args.cache_dir,
+                args.cache_mb * 1024 * 1024): f
+                for f in filenames}
+
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                times = future.result()
+            except Exception as e:
+                failures += 1
+                print("FAILED %s: %s" % (filename, e), file=sys.stderr)
+            else:
+                print("%s: load %.3fs, collage %.3fs, save %.3fs, total %.3fs"
+                        % (filename, times["load"], times["collage"],
+                            times["save"], times["total"]))
+
+    print("%d of %d collages made in %.3fs" % (len(filenames) - failures,
+            len(filenames), time.perf_counter() - start))
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Module: benchmarks
+
+Times the main operations of comp110_image and collage_creator on synthetic
+pictures of several sizes, so that changes can be checked for speed
+regressions.
+
+Example:
+    python benchmarks.py -o before.json
+    ... change something ...
+    python benchmarks.py -o after.json --compare before.json
+
+For every benchmark and size the best and median time of several runs are
+recorded, along with the throughput in megapixels per second and the peak
+memory allocated by Python during one run (measured with tracemalloc, in a
+separate run so that it doesn't slow down the timed ones). The results are
+written as JSON.
+
+Some benchmarks (e.g. iterating over pictures pixel by pixel) take minutes
+on the biggest pictures, so by default they are skipped on pictures bigger
+than --slow-limit pixels.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import collage_creator
+import comp110_image
+import filter_engine
+import integral
+import transform
+
+# Default width (and height) of the square test pictures
+DEFAULT_SIZES = (256, 1024, 4096)
+
+# Default number of timed runs of each benchmark
+DEFAULT_REPEAT = 3
+
+# Benchmarks marked as slow are skipped on pictures with more pixels than this
+DEFAULT_SLOW_LIMIT = 1024 * 1024
+
+
+def synthetic_picture(width, height):
+    """
+    Returns a picture with a fixed pattern: red increases to the right,
+    green increases downwards and blue is a diagonal ramp. The same size
+    always gives the same picture.
+    """
+    red = bytes(x * 255 // max(1, width - 1) for x in range(width))
+    ramp = bytes(range(256)) * (width // 256 + 2)
+
+    data = bytearray(width * height * 3)
+    row_size = width * 3
+    for y in range(height):
+        start = y * row_size
+        end = start + row_size
+        data[start:end:3] = red
+        data[start + 1:end:3] = bytes([y * 255 // max(1, height - 1)]) * width
+        data[start + 2:end:3] = ramp[y % 256:y % 256 + width]
+
+    return comp110_image.Picture(width, height, title="synthetic", data=data)
+
+
+class Benchmark:
+    """
+    One thing to time.
+
+    setup(pic, workdir) is called (untimed) before every run and returns the
+    arguments for run, whose call is what gets timed.
+    """
+
+    def __init__(self, name, run, setup=None, slow=False):
+        self.name = name
+        self.run = run
+        self.setup = setup if setup is not None else lambda pic, workdir: (pic,)
+        self.slow = slow
+
+
+def _iterate(pic):
+    for pixel in pic:
+        pass
+
+
+def _saved(extension):
+    """Returns a setup function that saves the picture to a file first."""
+    def setup(pic, workdir):
+        filename = os.path.join(workdir, "load" + extension)
+        if not os.path.exists(filename):
+            pic.save(filename)
+        return (filename,)
+    return setup
+
+
+def _save_to(extension):
+    """Returns a setup function giving the picture and a file to save it to."""
+    def setup(pic, workdir):
+        return (pic, os.path.join(workdir, "save" + extension))
+    return setup
+
+
+def make_benchmarks(backend=None):
+    """Returns the list of Benchmarks, using the given filter backend."""
+    benchmarks = [
+        Benchmark("load_png", lambda f: comp110_image.Picture(filename=f),
+                _saved(".png")),
+        Benchmark("save_png", lambda pic, f: pic.save(f), _save_to(".png")),
+        Benchmark("load_raw", lambda f: comp110_image.Picture(filename=f).getBytes(),
+                _saved(comp110_image.RAW_EXTENSION)),
+        Benchmark("save_raw", lambda pic, f: pic.save(f),
+                _save_to(comp110_image.RAW_EXTENSION)),
+        Benchmark("copy", lambda pic: pic.copy()),
+        Benchmark("copy_and_change",
+                lambda pic: pic.copy().setColor(0, 0, comp110_image.Red)),
+        Benchmark("eq", lambda pic, other: pic == other,
+                lambda pic, workdir: (pic, comp110_image.Picture(
+                    pic.getWidth(), pic.getHeight(), data=pic.getBytes()))),
+        Benchmark("iterate", _iterate, slow=True),
+        Benchmark("iterate_rows", lambda pic: sum(1 for row in pic.iter_rows())),
+        Benchmark("map_pixels", lambda pic: pic.map_pixels(
+                lambda r, g, b: (255 - r, 255 - g, 255 - b)),
+                lambda pic, workdir: (pic.copy(),), slow=True),
+    ]
+
+    for name in ("unique_filter", "flip_filter", "mirror_x", "mirror_filter",
+            "gray_filter"):
+        function = getattr(collage_creator, name)
+        benchmarks.append(Benchmark(name,
+                lambda pic, function=function: function(pic, backend)))
+
+    benchmarks += [
+        Benchmark("convolution", lambda pic: collage_creator.convolution(
+                pic, collage_creator.EDGE_KERNEL, backend=backend),
+                slow=filter_engine.get_backend(backend) == "python"),
+        Benchmark("box_blur_3", lambda pic: integral.box_blur(pic, 3, backend),
+                lambda pic, workdir: (pic.copy(),)),
+        Benchmark("box_blur_30", lambda pic: integral.box_blur(pic, 30, backend),
+                lambda pic, workdir: (pic.copy(),)),
+        Benchmark("shrink", lambda pic: collage_creator.shrink(pic, 2)),
+        Benchmark("area_reduce_8", lambda pic: integral.reduce(pic, 8, backend),
+                lambda pic, workdir: (pic.copy(),)),
+        Benchmark("transpose", lambda pic: transform.transpose(pic, backend)),
+        Benchmark("rotate_90", lambda pic: transform.rotate(pic, 90, backend)),
+        Benchmark("copy_to", collage_creator.copy_to,
+                lambda pic, workdir: (pic, comp110_image.Picture(
+                    pic.getWidth(), pic.getHeight()), 0, 0),
+                slow=True),
+        Benchmark("collage", lambda pic: collage_creator.create_collage(pic,
+                pic.getWidth(), pic.getHeight(), backend)),
+    ]
+    return benchmarks
+
+
+def time_benchmark(benchmark, pic, workdir, repeat):
+    """
+    Runs a benchmark repeat times on pic.
+
+    Returns:
+    (type: dict) - The best and median time in seconds, throughput in
+        megapixels per second (based on the best time) and peak memory in
+        bytes.
+    """
+    times = []
+    for i in range(repeat):
+        args = benchmark.setup(pic, workdir)
+        start = time.perf_counter()
+        benchmark.run(*args)
+        times.append(time.perf_counter() - start)
+
+    args = benchmark.setup(pic, workdir)
+    tracemalloc.start()
+    try:
+        benchmark.run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    megapixels = pic.getWidth() * pic.getHeight() / 1e6
+    return {
+        "best": best,
+        "median": statistics.median(times),
+        "megapixels_per_second": megapixels / best if best > 0 else None,
+        "peak_memory": peak,
+    }
+
+
+def git_commit():
+    """Returns the current git commit of the repository, or None."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, backend=None,
+        names=None, slow_limit=DEFAULT_SLOW_LIMIT, progress=None):
+    """
+    Runs the benchmarks on synthetic square pictures.
+
+    Parameters:
+    sizes (type: list of int) - Widths (and heights) of the pictures.
+    repeat (type: int) - How many timed runs to do of each benchmark.
+    backend (type: str) - "python" or "numpy" (see filter_engine).
+    names (type: list of str) - Only run the benchmarks with these names (all
+        of them if None).
+    slow_limit (type: int) - Slow benchmarks are skipped on pictures with more
+        pixels than this (None to never skip them).
+    progress (type: function) - Called with a line of text after each
+        benchmark, if given.
+
+    Returns:
+    (type: dict) - The results, ready to be saved as JSON.
+    """
+    backend = filter_engine.get_backend(backend)
+    benchmarks = make_benchmarks(backend)
+    if names is not None:
+        unknown = set(names) - {b.name for b in benchmarks}
+        if unknown:
+            raise ValueError("unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+        benchmarks = [b for b in benchmarks if b.name in names]
+
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend,
+        "repeat": repeat,
+        "results": {},
+    }
+
+    for size in sizes:
+        pic = synthetic_picture(size, size)
+        key = "%dx%d" % (size, size)
+        results["results"][key] = {}
+
+        with tempfile.TemporaryDirectory() as workdir:
+            for benchmark in benchmarks:
+                if benchmark.slow and slow_limit is not None \
+                        and size * size > slow_limit:
+                    result = {"skipped": "slow"}
+                    line = "%s %s: skipped" % (key, benchmark.name)
+                else:
+                    result = time_benchmark(benchmark, pic, workdir, repeat)
+                    line = "%s %s: %.4fs (%.1f MP/s, %.1f MB peak)" % (key,
+                            benchmark.name, result["best"],
+                            result["megapixels_per_second"] or 0,
+                            result["peak_memory"] / 1e6)
+
+                results["results"][key][benchmark.name] = result
+                if progress is not None:
+                    progress(line)
+
+    return results
+
+
+def compare(old, new):
+    """
+    Returns lines comparing the best times of two sets of results (as
+    returned by run_benchmarks), e.g. "1024x1024 eq: 3.2000s -> 0.0010s
+    (3200.00x faster)".
+    """
+    lines = []
+    for key, benchmarks in new["results"].items():
+        for name, result in benchmarks.items():
+            before = old["results"].get(key, {}).get(name, {})
+            if "best" not in result or "best" not in before:
+                continue
+            ratio = before["best"] / result["best"] if result["best"] > 0 else None
+            if ratio is None:
+                change = ""
+            elif ratio >= 1:
+                change = " (%.2fx faster)" % ratio
+            else:
+                change = " (%.2fx slower)" % (1 / ratio)
+            lines.append("%s %s: %.4fs -> %.4fs%s" % (key, name, before["best"],
+                    result["best"], change))
+    return lines
+
+
+def parse_args(argv=None):
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1],
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--sizes", type=int, nargs="+",
+            default=list(DEFAULT_SIZES),
+            help="widths of the square test pictures (default: 256 1024 4096)")
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+            help="timed runs of each benchmark (default: %d)" % DEFAULT_REPEAT)
+    parser.add_argument("-b", "--benchmark", action="append", dest="names",
+            help="only run this benchmark (may be given more than once)")
+    parser.add_argument("--backend", choices=("python", "numpy"),
+            help="filter backend (default: numpy if installed)")
+    parser.add_argument("--slow-limit", type=int, default=DEFAULT_SLOW_LIMIT,
+            help="skip slow benchmarks on pictures with more pixels than this "
+                    "(0 for no limit)")
+    parser.add_argument("-o", "--output",
+            help="file to write the JSON results to (default: print them)")
+    parser.add_argument("--compare", metavar="JSON",
+            help="earlier results to compare against")
+    parser.add_argument("-q", "--quiet", action="store_true",
+            help="don't print progress")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    progress = None if args.quiet else lambda line: print(line, file=sys.stderr)
+
+    try:
+        results = run_benchmarks(args.sizes, args.repeat, args.backend,
+                args.names, args.slow_limit or None, progress)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        for line in compare(old, results):
+            print(line, file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,7 +9,34 @@ Authors:
 """
 
 import comp110_image
+import contextlib
+import convolution_engine
+import filter_engine
+import instrumentation
 import math
+import os
+import resample
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+# Edge detection kernel used for the convolution picture in the collage
+EDGE_KERNEL = [[-1, -1, -1], [-1, 8, -1], [-1, -1, -1]]
+
+# Number of filtered pictures in a collage
+NUM_FILTERS = 6
+
+# (column, row) of the tile each filtered picture goes in, in the order of
+# create_filtered_pics
+COLLAGE_LAYOUT = ((0, 0), (1, 0), (2, 0), (1, 1), (0, 1), (2, 1))
+
+# Names of the filters, in the order of create_filtered_pics (used as the
+# names of their instrumentation stages)
+FILTER_NAMES = ("unique_filter", "convolution", "flip_filter", "mirror_filter",
+        "mirror_x", "gray_filter")
+
+# Environment variable naming a file to write a trace of main's stages to
+# (see instrumentation)
+TRACE_ENV = "COLLAGE_TRACE"
 
 def copy_to(src_img, dest_img, start_x, start_y):
     """
@@ -28,7 +55,7 @@ def copy_to(src_img, dest_img, start_x, start_y):
             srcPixel = src_img.getPixel(x,y)
             dest_img.setPixel(x + start_x, y + start_y, srcPixel)
 
-def unique_filter(img):
+def unique_filter(img, backend=None, out=None):
 
     """
     Creates filter that makes the image brighter
@@ -36,59 +63,34 @@ def unique_filter(img):
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
     Returns
     pic0(Type: image)
 
     """
-    
-    pic0 = img.copy()
-    x = img.getHeight()
-    for row in range(x):
-        for col in range(img.getWidth()):
-            p = pic0.getPixel(col, row)
-
-            red = p.getRed()
-            green = p.getGreen()
-            blue = p.getBlue()
-
-
-            red = red * 1.5
-            green = green * 1.5
-            blue = blue * 1.5
-
-            if red < 0:
-                red = 0
-            elif red > 255:
-                red = 255
-            
-            if green < 0:
-                green = 0
-            elif green > 255:
-                green = 255
-
-            if blue < 0:
-                blue = 0
-            elif blue > 255:
-                blue = 255
-
-            p.setRed(int(red))
-            p.setGreen(int(green))
-            p.setBlue(int(blue))
 
-    
-    return pic0
+    return filter_engine.brightness(img, 1.5, backend, out)
+
 
 def apply_kernel(img, filtered_img, x, y, kernel):
     """
     Applies the given kernel to the pixel in img at (x,y).
 
+    This is the slow, one-pixel-at-a-time version of
+    convolution_engine.convolve, useful for checking its results.
+
     Params:
     img (type: Picture) - The original (unmodified) image.
     filtered_img (type: Picture) - A copy of the original that will have the
         kernel applied to it.
     x (type: int) - The x value of the pixel to modify
     y (type: int) - The y value of the pixel to modify
-    kernel (type: 2D list of int) - The kernel to apply.
+    kernel (type: 2D list of int) - The kernel to apply. It may be any size
+        with an odd number of rows and columns.
     """
 
     # accumulator variables
@@ -96,130 +98,96 @@ def apply_kernel(img, filtered_img, x, y, kernel):
     green_sum = 0
     blue_sum = 0
 
-    for i in range(-1, 2):
-        for j in range(-1, 2):
-            x = x + j
-            y = y + i
-
-            pixel = img.getPixel(x,y)
-            red = pixel.getRed()
-            green = pixel.getGreen()
-            blue = pixel.getBlue()
-          
-            red_sum += red * kernel[i+1][j+1]
-            green_sum += green * kernel[i+1][j+1]
-            blue_sum += blue * kernel[i+1][j+1]
-
-#Red check
-    if 0 > red_sum:
-        red_sum = 0
-    elif 255 < red_sum:
-        red_sum = 255
-
-#Green check
-    if 0 > green_sum:
-        green_sum = 0
-    elif 255 < green_sum:
-        green_sum = 255
-
-#Blue check
-    if 0 > blue_sum:
-        blue_sum = 0
-    elif 255 < blue_sum:
-        blue_sum = 255
-
- 
+    ry = len(kernel) // 2
+    rx = len(kernel[0]) // 2
+
+    for i in range(-ry, ry + 1):
+        for j in range(-rx, rx + 1):
+            pixel = img.getPixel(x + j, y + i)
+            weight = kernel[i + ry][j + rx]
+
+            red_sum += pixel.getRed() * weight
+            green_sum += pixel.getGreen() * weight
+            blue_sum += pixel.getBlue() * weight
+
+    # round and clip each sum to the range 0 to 255
+    red_sum = min(255, max(0, round(red_sum)))
+    green_sum = min(255, max(0, round(green_sum)))
+    blue_sum = min(255, max(0, round(blue_sum)))
+
     pixel = filtered_img.getPixel(x,y)
     pixel.setRed(red_sum)
     pixel.setGreen(green_sum)
     pixel.setBlue(blue_sum)
 
 
-def convolution(img, kernel):
+def convolution(img, kernel, border="skip", backend=None, out=None):
     """
-    Performs convolution on all non-border pixels in the img, using the given
+    Performs convolution on all pixels in the img, using the given
     convolution kernel.
 
+    By default border pixels (where the kernel would not fit inside the
+    picture) are left unchanged; see convolution_engine for other border
+    modes.
+
     Params:
     img (type: Picture) - The picture to modify.
-    kernel (type: 2D list of int) - The kernel to apply.
-    """
+    kernel (type: 2D list of int) - The kernel to apply (any odd size).
+    border (type: str) - "skip", "clamp", "reflect" or "wrap".
+    backend (type: str) - "python" or "numpy" (see filter_engine)
+    out (type: Picture) - Picture to write the result into (a new picture is
+        made if None). It must not share pixels with img.
 
-    # Makes a copy of the original image. This copy will be modified while the
-    # original will remain unchanged.
-    filtered_img = img.copy()
-
-    # Avoids border pixels
-    width = img.getWidth()
-    height = img.getHeight()
-    for x in range(1, width - 1):
-        for y in range(1, height - 1):
-            
-            apply_kernel(img, filtered_img, x, y, kernel)
+    Returns:
+    (type: Picture) - A filtered copy of img.
+    """
 
-    return filtered_img
+    return convolution_engine.convolve(img, kernel, border, backend=backend,
+            out=out)
 
 
 
-def flip_filter(img):
+def flip_filter(img, backend=None, out=None):
     """
     Flips image upside down
 
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
     Returns
     img_copy(Type: image)
     
     """
 
-    img_copy = img.copy()
-    w = img_copy.getWidth()
-    h = img_copy.getHeight()
-    for x in range(w):
-        for y in range(h//2):
-            top_pix = img.getPixel(x,y)
-            bottom_pix = img.getPixel(x,h-1-y)
-            img_copy.setPixel(x,h-1-y, top_pix)
-            img_copy.setPixel(x,y,bottom_pix)
+    return filter_engine.flip_vertical(img, backend, out)
 
-    for x in range(w):
-        for y in range(-h//2):
-            top_pix = img.getPixel(x,y)
-            bottom_pix = img.getPixel(x,h-1-y)
-            img_copy.setPixel(x,h-1-y, top_pix)
-            img_copy.setPixel(x,y,bottom_pix)
 
-    return img_copy
-
-
-def mirror_x(img):
+def mirror_x(img, backend=None, out=None):
     """ 
     Mirrors image over x axis
 
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
     Returns
     img_copy(Type: image)
 
     """
 
-    img_copy = img.copy()
-    w = img_copy.getWidth()
-    h = img_copy.getHeight()
-    for x in range(w):
-        for y in range(h//2):
-            top_pix = img_copy.getPixel(x,y)
-            bottom_pix = img_copy.getPixel(x,h-1-y)
-            img_copy.setPixel(x,h-1-y, top_pix)
-            img_copy.setPixel(x,y,bottom_pix)
-
-
-    return img_copy
+    return filter_engine.mirror_vertical(img, backend, out)
 
 
-def mirror_filter(img):
+def mirror_filter(img, backend=None, out=None):
 
     """
     Mirrors image over the y axis
@@ -227,23 +195,19 @@ def mirror_filter(img):
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
     Returns
     img_copy(Type: image)
     """
 
-    img_copy = img.copy()
-    w = img_copy.getWidth()
-    mirror_pt = w // 2
-    for y in range(img_copy.getHeight()):
-        for x in range(mirror_pt):
-            left_pix = img_copy.getPixel(x,y)
-            right_pix = img_copy.getPixel(w-1-x,y)
-            img_copy.setPixel(w-1-x,y,left_pix)
-            img_copy.setPixel(x,y,right_pix)
-    
-    return img_copy
+    return filter_engine.mirror_horizontal(img, backend, out)
 
-def gray_filter(img):
+
+def gray_filter(img, backend=None, out=None):
 
     """
     Creates filter that applies a gray filter
@@ -251,43 +215,195 @@ def gray_filter(img):
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
     Returns
     img_copy(Type: image)
     """
 
-    img_copy = img.copy()
-    x = img_copy.getHeight()
-    for row in range(x):
-        for col in range(img_copy.getWidth()):
-            p = img_copy.getPixel(col,row)
+    return filter_engine.grayscale(img, backend, out)
+
+
+def apply_collage_filter(index, img, backend=None, out=None):
+    """
+    Applies one of the six collage filters to an image.
 
-            red = p.getRed()
-            green = p.getGreen()
-            blue = p.getBlue()
+    Parameters:
+    index(type: int) - Which filter to apply, in the order used by
+        create_filtered_pics (0 to 5).
 
-            gray = int((red + green + blue)/3)
-            p.setRed(gray)
-            p.setGreen(gray)
-            p.setBlue(gray)
+    img(type: Image)
+
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    out(type: Image) - picture to write the result into, e.g. a view of a
+        tile of the collage (a new picture is made if None)
+
+    Returns
+    filtered(Type: image)
+    """
 
-    return img_copy
+    if not 0 <= index < NUM_FILTERS:
+        raise ValueError("filter index must be between 0 and %d"
+                % (NUM_FILTERS - 1))
+
+    with instrumentation.stage(FILTER_NAMES[index],
+            img.getWidth() * img.getHeight()):
+        if index == 0:
+            return unique_filter(img, backend, out)
+        elif index == 1:
+            return convolution(img, EDGE_KERNEL, backend=backend, out=out)
+        elif index == 2:
+            return flip_filter(img, backend, out)
+        elif index == 3:
+            return mirror_filter(img, backend, out)
+        elif index == 4:
+            return mirror_x(img, backend, out)
+        else:
+            return gray_filter(img, backend, out)
+
+
+def _filter_shared_picture(index, width, height, title, src_name, dest_name,
+        backend):
+    """
+    Applies a collage filter in a worker process.
 
-def create_filtered_pics(img):
+    The source pixels are read from the shared memory block named src_name,
+    and the result is written into slot index of the shared memory block
+    named dest_name, so no pictures have to be pickled.
+    """
+    size = width * height * 3
+    src = shared_memory.SharedMemory(name=src_name)
+    dest = shared_memory.SharedMemory(name=dest_name)
+    try:
+        img = comp110_image.Picture(width, height, title=title,
+                data=src.buf[:size])
+        filtered = apply_collage_filter(index, img, backend)
+        dest.buf[index * size:(index + 1) * size] = filtered.getBytes()
+    finally:
+        src.close()
+        dest.close()
+
+
+def _create_filtered_pics_in_processes(img, backend, executor, outs):
+    """Runs the six collage filters on a process pool (see create_filtered_pics)."""
+    width, height = img.getWidth(), img.getHeight()
+    size = width * height * 3
+
+    # shared memory blocks can't be empty
+    src = shared_memory.SharedMemory(create=True, size=max(1, size))
+    dest = shared_memory.SharedMemory(create=True, size=max(1, size * NUM_FILTERS))
+    try:
+        src.buf[:size] = img.getBytes()
+        futures = [executor.submit(_filter_shared_picture, i, width, height,
+                img.getTitle(), src.name, dest.name, backend)
+                for i in range(NUM_FILTERS)]
+        for future in futures:
+            future.result()
+
+        if outs is None:
+            outs = [comp110_image.Picture(width, height, title=img.getTitle())
+                    for i in range(NUM_FILTERS)]
+        for i, out in enumerate(outs):
+            out.setBytes(dest.buf[i * size:(i + 1) * size])
+        return tuple(outs)
+    finally:
+        src.close()
+        src.unlink()
+        dest.close()
+        dest.unlink()
+
+
+def create_filtered_pics(img, backend=None, parallel=None, executor=None,
+        outs=None):
     """
     Creates a tuple of photos with the given filters applied
 
+    The six filters are independent of each other, so they can also be run
+    at the same time:
+    - parallel="thread" runs them on a thread pool. This only helps when the
+      filters release the GIL (e.g. with the numpy backend).
+    - parallel="process" runs them on a process pool. The source pixels and
+      the results are passed through shared memory instead of being pickled.
+
     Parameters:
     img(type: Image)
 
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    parallel(type: str) - None (one filter after another), "thread" or
+        "process"
+
+    executor(type: Executor) - An existing pool of the matching kind to run
+        the filters on. If None, a pool is created just for this call.
+
+    outs(type: tuple) - Six pictures to write the results into, e.g. the
+        tiles returned by collage_tiles (new pictures are made if None)
+
     Returns
     img_tuple(Type: tuple)
     """
 
-    img_tuple = (unique_filter(img), convolution(img, [[-1, -1, -1], [-1, 8, -1], [-1, -1, -1]]), flip_filter(img), mirror_filter(img), mirror_x(img), gray_filter(img))
+    if outs is None:
+        outs = (None,) * NUM_FILTERS
+
+    if parallel == "thread" and executor is None:
+        with ThreadPoolExecutor(NUM_FILTERS) as pool:
+            return create_filtered_pics(img, backend, parallel, pool, outs)
+    if parallel == "process" and executor is None:
+        with ProcessPoolExecutor(NUM_FILTERS) as pool:
+            return create_filtered_pics(img, backend, parallel, pool, outs)
+
+    with instrumentation.stage("create_filtered_pics",
+            img.getWidth() * img.getHeight() * NUM_FILTERS, parallel=parallel):
+        if parallel is None:
+            img_tuple = tuple(apply_collage_filter(i, img, backend, outs[i])
+                    for i in range(NUM_FILTERS))
+
+        elif parallel == "thread":
+            img_tuple = tuple(executor.map(apply_collage_filter,
+                    range(NUM_FILTERS), [img] * NUM_FILTERS,
+                    [backend] * NUM_FILTERS, outs))
+
+        elif parallel == "process":
+            # the filters' own stages run in the workers, where nothing is
+            # listening, so only this stage is recorded
+            if outs[0] is None:
+                outs = None
+            img_tuple = _create_filtered_pics_in_processes(img, backend,
+                    executor, outs)
+
+        else:
+            raise ValueError("parallel must be None, 'thread' or 'process', "
+                    "not %r" % (parallel,))
+
     return img_tuple
 
 
 
+def collage_tiles(collage, tile_w, tile_h):
+    """
+    Returns views of the six tiles of a collage, in the same order as
+    create_filtered_pics. Writing into a view changes the collage directly.
+
+    Parameters
+    collage(type: image)
+
+    tile_w(type: int) - width of one tile
+
+    tile_h(type: int) - height of one tile
+
+    Returns
+    tiles(type: tuple)
+    """
+
+    return tuple(collage.getView(col * tile_w, row * tile_h, tile_w, tile_h)
+            for col, row in COLLAGE_LAYOUT)
+
+
 def assemble_collage(filtered_pics):
     """
     Assembles a collage of six filtered pictures.
@@ -302,14 +418,13 @@ def assemble_collage(filtered_pics):
 
     x = filtered_pics[0].getWidth()
     y = filtered_pics[0].getHeight()
-    collage = comp110_image.Picture(x * 3, y * 2)
 
-    copy_to(filtered_pics[0], collage, 0, 0)
-    copy_to(filtered_pics[1], collage, x, 0)
-    copy_to(filtered_pics[2], collage, x * 2, 0)
-    copy_to(filtered_pics[3], collage, x, y)
-    copy_to(filtered_pics[4], collage, 0, y)
-    copy_to(filtered_pics[5], collage, x * 2, y)
+    with instrumentation.stage("assemble_collage", x * y * NUM_FILTERS):
+        collage = comp110_image.Picture(x * 3, y * 2)
+
+        # copy each picture into its tile a whole row at a time
+        for pic, tile in zip(filtered_pics, collage_tiles(collage, x, y)):
+            tile.setBytes(pic.getBytes())
 
     return collage
 
@@ -319,6 +434,9 @@ def shrink(img, scale_factor):
     """
     shrinks image
 
+    Keeps the top left pixel of every scale_factor x scale_factor block. See
+    the resample module for smoother (averaging) ways to shrink a picture.
+
     Parameters:
     img(type: Image)
 
@@ -328,17 +446,10 @@ def shrink(img, scale_factor):
     shrunk_image(Type: image)
 
     """
-    shrunk_img = comp110_image.Picture(img.getWidth() // scale_factor, img.getHeight() // scale_factor)
 
-    for x in range(shrunk_img.getWidth()):
-        for y in range(shrunk_img.getHeight()):
-            scale_x = x * scale_factor
-            scale_y = y * scale_factor
-
-            scaled_pixel = img.getPixel(scale_x, scale_y)
-            shrunk_img.setPixel(x, y, scaled_pixel) 
-
-    return shrunk_img
+    with instrumentation.stage("shrink", img.getWidth() * img.getHeight(),
+            factor=scale_factor):
+        return resample.subsample(img, scale_factor)
 
 def get_shrink_factor(img, max_w, max_h):
 
@@ -360,14 +471,57 @@ def get_shrink_factor(img, max_w, max_h):
     h = math.ceil(img.getHeight() / max_h)
 
     a = max(w, h)
-    print(a)
 
     if a == 0:
         a = 1
-    
+
+    instrumentation.event("shrink_factor", factor=a)
     return a 
 
 
+def create_collage(pic, max_w, max_h, backend=None, parallel=None,
+        pyramid=False):
+    """
+    Shrinks a picture to fit and assembles the six filtered copies of it
+    into a collage.
+
+    The picture is resampled (by area averaging) to the largest tile size for
+    which three tiles across and two down fit in max_w x max_h.
+
+    Parameters:
+    pic(type: Image)
+
+    max_w(type: int) - maximum width of the collage
+
+    max_h(type: int) - maximum height of the collage
+
+    backend(type: str) - "python" or "numpy" (see filter_engine)
+
+    parallel(type: str) - None, "thread" or "process" (see
+        create_filtered_pics)
+
+    pyramid(type: bool) - whether to shrink from pic's pyramid, which is
+        much faster when collages of several sizes are made from the same
+        picture (see resample.resize)
+
+    Returns
+    collage(type: image)
+    """
+
+    with instrumentation.stage("shrink", pic.getWidth() * pic.getHeight(),
+            method="area", pyramid=pyramid):
+        shrink_pic = resample.fit(pic, max_w // 3, max_h // 2, "area",
+                pyramid=pyramid)
+    w = shrink_pic.getWidth()
+    h = shrink_pic.getHeight()
+
+    # each filter writes its result straight into its tile of the collage
+    collage = comp110_image.Picture(w * 3, h * 2)
+    create_filtered_pics(shrink_pic, backend, parallel,
+            outs=collage_tiles(collage, w, h))
+    return collage
+
+
 def main():
     """
     starts program
@@ -377,6 +531,10 @@ def main():
 
     Returns:
     Collage(type: image)
+
+    If the COLLAGE_TRACE environment variable is set, a trace of the time
+    spent in each stage is written to the file it names (see
+    instrumentation).
     """
     image_filename = input("Enter the name of a picture file: ")
     copy_file = input("Enter the filename you will save the collage to")
@@ -388,17 +546,31 @@ def main():
 
     h = int(input("Enter the maximum height of the collage: "))
 
-    while h < 1:
+    while h < 2:
         h = int(input("Enter the maximum height of the collage: "))
     
-    pic = comp110_image.Picture(filename= image_filename)
-    shrink_dim = get_shrink_factor(pic, w // 3, h // 2)
-    shrink_pic = shrink(pic, shrink_dim)
-    pics = create_filtered_pics(shrink_pic)
-    collage = assemble_collage(pics)
-
-    collage.show()
-    collage.save(copy_file)
+    trace_file = os.environ.get(TRACE_ENV)
+    if trace_file:
+        recorder = instrumentation.Recorder(allocations=True)
+    else:
+        recorder = contextlib.nullcontext()
+
+    with recorder:
+        # only the shrunk picture is needed, so load it at (or near) that
+        # size to begin with
+        with instrumentation.stage("load") as record:
+            pic = resample.load_fit(image_filename, w // 3, h // 2)
+            record["pixels"] = pic.getWidth() * pic.getHeight()
+
+        collage = create_collage(pic, w, h)
+
+        collage.show()
+        with instrumentation.stage("save",
+                collage.getWidth() * collage.getHeight()):
+            collage.save(copy_file)
+
+    if trace_file:
+        recorder.write_trace(trace_file)
 
 if __name__ == "__main__":
     
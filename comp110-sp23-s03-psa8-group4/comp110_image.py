@@ -6,25 +6,70 @@ Module that allows for basic 2D image manipulation.
 Author: Sat Garcia (sat@sandiego.edu)
 """
 
+import functools
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import struct
 from tkinter import *
 from PIL import Image, ImageTk
 
+import lut
+
+# Every Color made so far, by (red, green, blue). Colors can't be changed, so
+# each color only ever needs one object (see Color).
+_color_table = {}
+
+
 class Color:
-    """ A class to represent an RGB color. """
+    """
+    A class to represent an RGB color.
 
-    def __init__(self, r, g, b):
-        # check that all components are in valid range
-        Color.check_rgb_value_range(r)
-        Color.check_rgb_value_range(g)
-        Color.check_rgb_value_range(b)
+    Colors can't be changed once made. Making the same color twice gives the
+    same object, so a picture with millions of pixels only needs one Color
+    object for each different color in it.
+    """
 
-        self.__red = int(r)
-        self.__green = int(g)
-        self.__blue = int(b)
+    __slots__ = ("__red", "__green", "__blue", "_bytes")
+
+    def __new__(cls, r, g, b):
+        color = _color_table.get((r, g, b))
+        if color is None:
+            # check that all components are in valid range
+            Color.check_rgb_value_range(r)
+            Color.check_rgb_value_range(g)
+            Color.check_rgb_value_range(b)
+            color = Color._trusted(int(r), int(g), int(b))
+        return color
+
+    @staticmethod
+    def _trusted(r, g, b):
+        """
+        Returns the Color with the given components, which must already be
+        ints between 0 and 255 (so nothing is checked).
+        """
+        color = _color_table.get((r, g, b))
+        if color is None:
+            color = object.__new__(Color)
+            color.__red = r
+            color.__green = g
+            color.__blue = b
+            # the color as 3 bytes, ready to copy into a picture
+            color._bytes = bytes((r, g, b))
+            color = _color_table.setdefault((r, g, b), color)
+        return color
+
+    def __reduce__(self):
+        return (Color, self.get_rgb())
 
     def copy(self):
-        """Returns a copy of this Color object."""
-        return Color(self.__red, self.__green, self.__blue)
+        """
+        Returns a copy of this Color object. Since Colors can't be changed,
+        this is the Color itself.
+        """
+        return self
 
     def check_rgb_value_range(val):
         """Checks if given value is within the valid range for an RGB
@@ -53,43 +98,42 @@ class Color:
         """Returns the average value of color components."""
         return (self.__red + self.__green + self.__blue) // 3
 
+    def __cannot_change(self):
+        raise AttributeError("Colors can't be changed: make a new Color "
+                "(or change the Pixel) instead")
+
     def set_rgb(self, new_rgb):
-        """Changes red, green, and blue components to given values."""
-        Color.check_rgb_value_range(new_rgb[0])
-        Color.check_rgb_value_range(new_rgb[1])
-        Color.check_rgb_value_range(new_rgb[2])
-        self.__red = int(new_rgb[0])
-        self.__green = int(new_rgb[1])
-        self.__blue = int(new_rgb[2])
+        """Colors can't be changed, so this raises an AttributeError."""
+        self.__cannot_change()
 
     def set_red(self, new_red):
-        """Changes value of red component."""
-        Color.check_rgb_value_range(new_red)
-        self.__red = int(new_red)
+        """Colors can't be changed, so this raises an AttributeError."""
+        self.__cannot_change()
 
     def set_green(self, new_green):
-        """Changes value of green component."""
-        Color.check_rgb_value_range(new_green)
-        self.__green = int(new_green)
+        """Colors can't be changed, so this raises an AttributeError."""
+        self.__cannot_change()
 
     def set_blue(self, new_blue):
-        """Changes value of blue component."""
-        Color.check_rgb_value_range(new_blue)
-        self.__blue = int(new_blue)
+        """Colors can't be changed, so this raises an AttributeError."""
+        self.__cannot_change()
 
     def __str__(self):
         return "Color: red = %d, green = %d, blue = %d" % (self.__red,
                 self.__green, self.__blue)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         return self.__red == other.get_red() \
                 and self.__green == other.get_green() \
                 and self.__blue == other.get_blue()
 
     def __ne__(self, other):
-        return self.__red != other.get_red() \
-                or self.__green != other.get_green() \
-                or self.__blue != other.get_blue()
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.__red, self.__green, self.__blue))
 
 
     # camelCase alternative naves
@@ -121,42 +165,131 @@ Navy = Color(0, 0, 128)
 Lavender = Color(230, 230, 250)
 
 
+class PixelBuffer:
+    """
+    The bytes holding the pixels of a Picture, which may be shared.
+
+    Copies of a Picture share the same bytes until one of them is changed
+    ("copy-on-write"): the copy being changed then gets its own bytes first.
+    Views of a Picture share the PixelBuffer object itself, so they always see
+    the same bytes as the Picture they came from.
+
+    The bytes may also be read-only (e.g. a memory mapped file, see
+    open_raw), in which case they are copied the first time they are changed.
+
+    Always read through the data attribute and get the bytes to change from
+    writable(), since the bytes may be swapped for a private copy.
+
+    The version attribute goes up every time the bytes may be changed, so
+    anything worked out from them can tell when it is out of date (see
+    Picture.cached).
+    """
+
+    __slots__ = ("data", "users", "readonly", "version")
+
+    def __init__(self, data, users=None, readonly=False):
+        self.data = data
+        # number of PixelBuffers sharing data (a list so that they can all
+        # update it)
+        self.users = [1] if users is None else users
+        self.readonly = readonly
+        self.version = 0
+
+    def share(self):
+        """Returns a new PixelBuffer sharing our bytes until either is changed."""
+        self.users[0] += 1
+        return PixelBuffer(self.data, self.users, self.readonly)
+
+    def writable(self):
+        """Returns our bytes for changing, copying them first if they are shared."""
+        if self.readonly or self.users[0] > 1:
+            self.__unshare(bytearray(self.data))
+        self.version += 1
+        return self.data
+
+    def replace(self, data):
+        """Replaces all of our bytes with the given ones."""
+        self.version += 1
+        if self.readonly or self.users[0] > 1:
+            # no need to copy the shared bytes when they are all replaced
+            self.__unshare(bytearray(data))
+        else:
+            self.data[:] = data
+
+    def __unshare(self, data):
+        """Stops sharing our bytes with other PixelBuffers, using data instead."""
+        self.users[0] -= 1
+        self.users = [1]
+        self.data = data
+        self.readonly = False
+
+    def __del__(self):
+        self.users[0] -= 1
+
+
 class Pixel:
-    """A class to represent a single pixel in an image."""
+    """
+    A class to represent a single pixel in an image.
+
+    A Pixel does not store its own color: it is a lightweight view onto three
+    bytes (red, green, blue) of a PixelBuffer. Pixels returned by a Picture
+    share that Picture's buffer, so changing them changes the Picture.
+    """
+
+    __slots__ = ("__x", "__y", "__buffer", "__offset")
 
     def __init__(self, color=None, x=0, y=0):
         self.__x = x
         self.__y = y
+        self.__buffer = PixelBuffer(bytearray(3))
+        self.__offset = 0
 
         # if color isn't specified, make a black pixel
-        if color is None:
-            self.__color = Color(0, 0, 0)
-        else:
+        if color is not None:
             self.set_color(color)
 
+    @classmethod
+    def _view(cls, buffer, offset, x, y):
+        """Returns a Pixel at (x, y) backed by bytes offset to offset+3 of buffer."""
+        pixel = object.__new__(cls)
+        pixel.__x = x
+        pixel.__y = y
+        pixel.__buffer = buffer
+        pixel.__offset = offset
+        return pixel
+
     def copy(self):
         """Returns a copy of this Pixel object."""
-        return Pixel(self.__color, self.__x, self.__y)
+        return Pixel._view(PixelBuffer(bytearray(self._get_bytes())), 0,
+                self.__x, self.__y)
+
+    def _get_bytes(self):
+        """Returns the 3 bytes of this pixel's color (always valid)."""
+        i = self.__offset
+        return self.__buffer.data[i:i+3]
 
     def get_rgb(self):
         """Returns color of pixel as an (r, g, b) tuple."""
-        return self.__color.get_rgb()
+        i = self.__offset
+        return tuple(self.__buffer.data[i:i+3])
 
     def get_color(self):
         """Returns color of pixel."""
-        return self.__color
+        i = self.__offset
+        data = self.__buffer.data
+        return Color._trusted(data[i], data[i+1], data[i+2])
 
     def get_red(self):
         """Returns red component of pixel."""
-        return self.__color.get_red()
+        return self.__buffer.data[self.__offset]
 
     def get_green(self):
         """Returns green component of pixel."""
-        return self.__color.get_green()
+        return self.__buffer.data[self.__offset + 1]
 
     def get_blue(self):
         """Returns blue component of pixel."""
-        return self.__color.get_blue()
+        return self.__buffer.data[self.__offset + 2]
 
     def get_x(self):
         """Returns x value of Pixel's location."""
@@ -168,15 +301,18 @@ class Pixel:
 
     def set_red(self, new_red):
         """Changes value of red component."""
-        self.__color.set_red(new_red)
+        Color.check_rgb_value_range(new_red)
+        self.__buffer.writable()[self.__offset] = int(new_red)
 
     def set_green(self, new_green):
         """Changes value of green component."""
-        self.__color.set_green(new_green)
+        Color.check_rgb_value_range(new_green)
+        self.__buffer.writable()[self.__offset + 1] = int(new_green)
 
     def set_blue(self, new_blue):
         """Changes value of blue component."""
-        self.__color.set_blue(new_blue)
+        Color.check_rgb_value_range(new_blue)
+        self.__buffer.writable()[self.__offset + 2] = int(new_blue)
 
     def set_color(self, new_color):
         """
@@ -185,22 +321,11 @@ class Pixel:
         The new color may be either a Color object, a Pixel object, or a tuple
         with (r, g, b) values.
         """
-        if isinstance(new_color, Color):
-            # If this is a Color object, set our color variable to a copy of it
-            self.__color = new_color.copy()
-        elif isinstance(new_color, tuple):
-            # if its a tuple, make a Color object first
-            if len(new_color) != 3:
-                raise ValueError("color tuple must be in format (r, g, b)")
-            self.__color = Color(new_color[0], new_color[1], new_color[2])
-        elif isinstance(new_color, Pixel):
-            # if its a Pixel, create new Color object from its RGB
-            self.__color = Color(new_color.get_red(), new_color.get_green(), new_color.get_blue())
-        else:
-            raise TypeError("color must be given as a Color, Pixel, or RGB tuple.")
+        i = self.__offset
+        self.__buffer.writable()[i:i+3] = _color_bytes_of(new_color)
 
     def __str__(self):
-        rgb = self.__color.get_rgb()
+        rgb = self.get_rgb()
         return "Pixel at (%d, %d) with red=%d, green=%d, blue=%d" % (self.__x,
                 self.__y, rgb[0], rgb[1], rgb[2])
 
@@ -213,12 +338,10 @@ class Pixel:
         """
         return self.__x == other.get_x() \
                 and self.__y == other.get_y() \
-                and self.__color == other.get_color()
+                and self.get_rgb() == other.get_rgb()
 
     def __ne__(self, other):
-        return self.__x != other.get_x() \
-                or self.__y != other.get_y() \
-                or self.__color != other.get_color()
+        return not self == other
 
     # camelCase alternative naves
     getRGB = get_rgb
@@ -234,42 +357,210 @@ class Pixel:
     setColor = set_color
 
 
+# PIL modes holding more than 8 bits per pixel, which must be scaled down
+HIGH_BIT_DEPTH_MODES = ("I", "I;16", "I;16B", "I;16L", "I;16N")
+
+
+def rgb_image(image):
+    """
+    Returns a version of a PIL Image in RGB mode.
+
+    Images in other modes (grayscale, palette, RGBA, CMYK, 16-bit, ...) are
+    converted to RGB. Alpha channels are dropped.
+    """
+    if image.mode == "RGB":
+        return image
+
+    if image.mode in HIGH_BIT_DEPTH_MODES:
+        # scale 0-65535 down to 0-255
+        image = image.convert("I").point(lambda v: v * (1 / 257)).convert("L")
+    elif image.mode == "P" and "transparency" in image.info:
+        image = image.convert("RGBA")
+
+    return image.convert("RGB")
+
+
+def draft_box(image, draft_size):
+    """
+    Asks PIL to decode a PIL Image straight at 1/2, 1/4 or 1/8 scale, as long
+    as the result is still at least draft_size (only JPEGs support this, the
+    rest are left alone).
+
+    The last row and column of a reduced image may stand for fewer pixels
+    than the others, so the part of it that covers the original picture can
+    end part way through them.
+
+    Returns:
+    (type: tuple) - That (left, top, right, bottom) part of the image, in
+        (possibly fractional) pixels of the image as it will be decoded.
+    """
+    draft = image.draft(None, tuple(draft_size))
+    if draft is None:
+        return (0, 0, image.width, image.height)
+    return draft[1]
+
+
+def _color_bytes_of(color):
+    """
+    Returns the 3 bytes (red, green, blue) of a Color, Pixel or (r, g, b)
+    tuple. Only tuples need to be checked: Colors and Pixels are always valid.
+    """
+    if isinstance(color, Color):
+        return color._bytes
+    if isinstance(color, Pixel):
+        return color._get_bytes()
+    if isinstance(color, tuple):
+        if len(color) != 3:
+            raise ValueError("color tuple must be in format (r, g, b)")
+        Color.check_rgb_value_range(color[0])
+        Color.check_rgb_value_range(color[1])
+        Color.check_rgb_value_range(color[2])
+        return bytes((int(color[0]), int(color[1]), int(color[2])))
+    raise TypeError("color must be given as a Color, Pixel, or RGB tuple.")
+
+
+def _color_bytes(colors):
+    """Returns a list of (r, g, b) tuples as bytes, checking every value."""
+    try:
+        return bytes(itertools.chain.from_iterable(colors))
+    except (TypeError, ValueError):
+        # not all plain ints in range: check (and convert) one at a time
+        values = list(itertools.chain.from_iterable(colors))
+        for value in values:
+            Color.check_rgb_value_range(value)
+        return bytes(int(value) for value in values)
+
+
+# Header of the raw picture format: magic, width, height. The RGB rows
+# follow it directly, with no padding.
+RAW_HEADER = struct.Struct("<8sII")
+RAW_MAGIC = b"C110RAW1"
+
+# File extension of the raw picture format
+RAW_EXTENSION = ".c110raw"
+
+
+def is_raw_file(filename):
+    """
+    Returns True if the given file is in the raw picture format.
+
+    Only files given by name (a str, bytes or os.PathLike) are checked, so
+    file objects are left for PIL to read.
+    """
+    if not isinstance(filename, (str, bytes, os.PathLike)):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(RAW_MAGIC)) == RAW_MAGIC
+
+
+def _map_raw(filename):
+    """
+    Memory maps a raw picture file.
+
+    Returns:
+    (type: tuple) - (width, height, data) where data is a read-only
+        memoryview of the file's RGB bytes.
+    """
+    with open(filename, "rb") as f:
+        header = f.read(RAW_HEADER.size)
+        if len(header) != RAW_HEADER.size:
+            raise ValueError("%s is too short to be a raw picture" % filename)
+        magic, width, height = RAW_HEADER.unpack(header)
+        if magic != RAW_MAGIC:
+            raise ValueError("%s is not a raw picture" % filename)
+
+        size = RAW_HEADER.size + width * height * 3
+        if size == RAW_HEADER.size:
+            # empty files can't be mapped, and there is nothing to map anyway
+            return width, height, memoryview(b"")
+        # the map stays open for as long as the memoryview is used
+        mapping = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    return width, height, memoryview(mapping)[RAW_HEADER.size:]
+
+
+def open_raw(filename, title=None):
+    """
+    Opens a picture saved with Picture.save_raw.
+
+    Nothing is read up front: the file is memory mapped, so its pixels are
+    read from disk (or the operating system's page cache) only when they are
+    used. Processes that open the same file share its pages. The picture is
+    copied into memory the first time it is changed.
+    """
+    return Picture(filename=filename, title=title)
+
+
 class Picture:
-    """This class represents a digital picture/image."""
+    """
+    This class represents a digital picture/image.
 
-    def __init__(self, width=100, height=100, title=None, pic=None, filename=None):
+    The pixels are stored row by row in a single bytearray, with three bytes
+    (red, green, blue) per pixel. Pixel objects are only created on demand, as
+    views onto that buffer.
+
+    A Picture may also be a view of a rectangular region of another Picture
+    (see get_view). A view shares the other picture's buffer, so it starts
+    "offset" bytes into the buffer and its rows are "stride" bytes apart.
+
+    Copying a Picture is cheap: the copy shares the original's bytes until
+    one of the two is changed (see PixelBuffer).
+    """
+
+    def __init__(self, width=100, height=100, title=None, pic=None, filename=None,
+            data=None, draft_size=None):
+        """
+        Makes a width x height black picture, or a copy of pic, or the
+        picture in the file called filename, or a width x height picture with
+        the RGB bytes in data.
+
+        When loading a file that is going to be shrunk, draft_size may be
+        given as the (width, height) it will be shrunk to. JPEGs are then
+        decoded straight at 1/2, 1/4 or 1/8 scale, as long as the result is
+        still at least draft_size, which is much faster and uses much less
+        memory than decoding the whole picture (see draft_box).
+        """
 
         if pic is not None:
             # If we were given an existing pic, then create a copy of that
             self.__width = pic.get_width()
             self.__height = pic.get_height()
-            self.__pixels = [[Pixel(pic.get_pixel(x, y), x, y) for x in
-                range(self.__width)] for y in range(self.__height)]
+            if isinstance(pic, Picture) and pic.is_contiguous():
+                self.__buffer = pic.__buffer.share()
+            else:
+                self.__buffer = PixelBuffer(bytearray(pic.get_bytes()))
             self.__title = pic.get_title()
 
+        elif filename is not None and is_raw_file(filename):
+            # Raw pictures are memory mapped instead of read in
+            self.__width, self.__height, data = _map_raw(filename)
+            self.__buffer = PixelBuffer(data, readonly=True)
+            self.__title = title
+
         elif filename is not None:
             # If we are given a filename, then open that file and read in
             image = Image.open(filename)
+            if draft_size is not None:
+                draft_box(image, draft_size)
             self.__width = image.width
             self.__height = image.height
 
-            def get_image_pixel(img, x, y):
-                """Returns Pixel with color of pixel at (x,y) in given image."""
-                if img.mode == "RGB":
-                    color = img.getpixel((x,y))
-                elif img.mode == "L":
-                    # luminence is grayscale... given as a single value
-                    l = img.getpixel((x,y))
-                    color = (l, l, l)
-                else:
-                    print(img.mode)
-                    raise RuntimeError("Image in %s has unsupported mode: %s" %
-                            (filename, img.mode))
-
-                return Pixel(color, x, y)
-
-            self.__pixels = [[get_image_pixel(image, x, y) 
-                for x in range(self.__width)] for y in range(self.__height)]
+            try:
+                image = rgb_image(image)
+            except ValueError:
+                raise RuntimeError("Image in %s has unsupported mode: %s" %
+                        (filename, image.mode))
+
+            self.__buffer = PixelBuffer(bytearray(image.tobytes()))
+            self.__title = title
+
+        elif data is not None:
+            # If we are given raw RGB bytes, copy them in as our pixels
+            if len(data) != width * height * 3:
+                raise ValueError("data must contain exactly width * height * 3 bytes")
+            self.__width = width
+            self.__height = height
+            self.__buffer = PixelBuffer(bytearray(data))
             self.__title = title
 
         else:
@@ -277,16 +568,174 @@ class Picture:
             # specified width and height.
             self.__width = width
             self.__height = height
-            self.__pixels = [[Pixel(Black, x, y) for x in range(width)] for y in range(height)]
+            self.__buffer = PixelBuffer(bytearray(width * height * 3))
             self.__title = title
 
+        self.__offset = 0
+        self.__stride = self.__width * 3
+        self.__cache = {}
+
     def copy(self):
-        """Returns a copy of this Pixel object."""
+        """
+        Returns a copy of this Pixel object.
+
+        No pixels are copied until either picture is changed.
+        """
         return Picture(pic=self)
 
+    def get_view(self, x, y, width, height):
+        """
+        Returns a Picture for the width x height region of this picture whose
+        top left corner is at (x,y).
+
+        No pixels are copied: the view shares this picture's pixels, so
+        changing one changes the other.
+        """
+        if x < 0 or y < 0 or width < 0 or height < 0 \
+                or x + width > self.__width or y + height > self.__height:
+            raise IndexError("region (%d, %d, %d, %d) is outside of the picture"
+                    % (x, y, width, height))
+
+        view = Picture.__new__(Picture)
+        view.__width = width
+        view.__height = height
+        view.__title = self.__title
+        view.__buffer = self.__buffer
+        view.__offset = self.__offset + y * self.__stride + x * 3
+        view.__stride = self.__stride
+        view.__cache = {}
+        return view
+
+    def get_flipped_view(self):
+        """
+        Returns a Picture for this picture upside down (the bottom row first).
+
+        No pixels are copied: the view reads this picture's rows in reverse
+        order, so changing one changes the other.
+        """
+        view = Picture.__new__(Picture)
+        view.__width = self.__width
+        view.__height = self.__height
+        view.__title = self.__title
+        view.__buffer = self.__buffer
+        view.__offset = self.__offset + max(0, self.__height - 1) * self.__stride
+        view.__stride = -self.__stride
+        view.__cache = {}
+        return view
+
+    def cached(self, key, compute):
+        """
+        Returns compute(self), working it out only once for as long as the
+        pixels of this picture don't change.
+
+        This is meant for things that are slow to work out from the pixels
+        and are used many times (e.g. integral.summed_area_table). key tells
+        apart different things cached for the same picture.
+        """
+        version = self.__buffer.version
+        entry = self.__cache.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, compute(self))
+            self.__cache[key] = entry
+        return entry[1]
+
+    def get_pyramid_size(self):
+        """
+        Returns how many levels this picture's pyramid has (see
+        get_pyramid_level): one more than the number of halvings it takes to
+        get down to a single pixel.
+        """
+        return max(0, max(self.__width, self.__height) - 1).bit_length() + 1
+
+    def get_pyramid_level(self, level):
+        """
+        Returns this picture shrunk 2 ** level times.
+
+        Level 0 is (a copy of) the picture itself, level 1 is half as wide
+        and high (each pixel the average of a 2x2 block), level 2 half of
+        that, and so on down to a single pixel. Odd sizes are rounded up, so level n is
+        ceil(width / 2 ** n) x ceil(height / 2 ** n) and pixel (x, y) of it
+        covers the pixels from (x * 2 ** n, y * 2 ** n) on.
+
+        Levels are only made when first asked for, each from the one before
+        it, and are kept with this picture until it changes, so shrinking the
+        same picture to many sizes only ever halves it once per level (see
+        resample.resize).
+
+        Parameters:
+        level (type: int) - From 0 to get_pyramid_size() - 1.
+
+        Returns:
+        (type: Picture) - A copy of the level, which may be changed freely.
+        """
+        if not 0 <= level < self.get_pyramid_size():
+            raise IndexError("pyramid level %d out of range" % level)
+        if level == 0:
+            # copies share their pixels until changed, so this is free
+            return self.copy()
+
+        # the list only holds levels 1 and up, so it doesn't keep a
+        # reference to this picture
+        levels = self.cached("pyramid", lambda pic: [])
+        while len(levels) < level:
+            image = (levels[-1] if levels else self).get_image().reduce(2)
+            levels.append(Picture(image.width, image.height,
+                    title=self.__title, data=image.tobytes()))
+
+        # copies share their pixels until changed, so this is free
+        return levels[level - 1].copy()
+
+    def get_pyramid_level_for(self, width, height):
+        """
+        Returns the smallest pyramid level (see get_pyramid_level) that is
+        still at least width x height, or 0 if even the picture itself is
+        smaller than that.
+        """
+        level = 0
+        while level + 1 < self.get_pyramid_size():
+            scale = 2 ** (level + 1)
+            if (self.__width + scale - 1) // scale < width \
+                    or (self.__height + scale - 1) // scale < height:
+                break
+            level += 1
+        return level
+
+    def is_contiguous(self):
+        """
+        Returns True if this picture's pixels fill its whole buffer, row after
+        row (i.e. it is not a view of part of a bigger picture).
+        """
+        return self.__offset == 0 and self.__stride == self.__width * 3 \
+                and len(self.__buffer.data) == self.__height * self.__stride
+
+    def get_buffer(self, writable=False):
+        """
+        Returns (buffer, offset, stride) for fast bulk access to the pixels.
+
+        Pixel (x,y) is stored at buffer[offset + y * stride + x * 3] (red)
+        and the two bytes after it (green, blue). The stride is negative for
+        upside down views (see get_flipped_view).
+
+        The buffer must not be changed unless writable is True. Since copies
+        share their bytes until changed, the buffer should not be kept: it
+        may no longer belong to this picture after the picture is copied and
+        changed.
+        """
+        if writable:
+            return (self.__buffer.writable(), self.__offset, self.__stride)
+        return (self.__buffer.data, self.__offset, self.__stride)
+
+    def __index(self, x, y):
+        """Returns index of the first byte of pixel (x,y) in our buffer."""
+        if not -self.__width <= x < self.__width \
+                or not -self.__height <= y < self.__height:
+            raise IndexError("pixel (%d, %d) is outside of the picture" % (x, y))
+        return self.__offset + (y % self.__height) * self.__stride \
+                + (x % self.__width) * 3
+
     def get_pixel(self, x, y):
         """Returns Pixel object at the specified (x,y) coordinates."""
-        return self.__pixels[y][x]
+        return Pixel._view(self.__buffer, self.__index(x, y), x, y)
 
     def set_color(self, x, y, color):
         """
@@ -294,7 +743,52 @@ class Picture:
 
         The color paramater may be a Pixel, a Color, or an (r, g, b) tuple.
         """
-        self.__pixels[y][x].set_color(color)
+        # write the bytes straight into our buffer, without making a Pixel
+        color = _color_bytes_of(color)
+        i = self.__index(x, y)
+        self.__buffer.writable()[i:i+3] = color
+
+    def get_bytes(self):
+        """
+        Returns the pixels of this picture as a bytes object.
+
+        Pixels are given row by row, top to bottom, with three bytes (red,
+        green, blue) for each pixel.
+        """
+        if self.is_contiguous():
+            return bytes(self.__buffer.data)
+
+        row_size = self.__width * 3
+        data = self.__buffer.data
+        return b"".join(data[start:start + row_size]
+                for start in self.__row_starts())
+
+    def set_bytes(self, data):
+        """
+        Replaces all of the pixels in this picture with the given bytes.
+
+        The data must be in the same format returned by get_bytes.
+        """
+        row_size = self.__width * 3
+        if len(data) != self.__height * row_size:
+            raise ValueError("data must contain exactly width * height * 3 bytes")
+
+        if self.is_contiguous():
+            self.__buffer.replace(data)
+            return
+
+        buffer = self.__buffer.writable()
+        data = memoryview(data)
+        for y, start in enumerate(self.__row_starts()):
+            buffer[start:start + row_size] = data[y * row_size:(y + 1) * row_size]
+
+    def __row_starts(self):
+        """Returns the buffer index of the start of each row."""
+        if self.__stride == 0:
+            # rows of an empty (zero width) picture all start in the same spot
+            return [self.__offset] * self.__height
+        return range(self.__offset, self.__offset + self.__height * self.__stride,
+                self.__stride)
 
     def get_title(self):
         return self.__title
@@ -308,52 +802,239 @@ class Picture:
     def get_height(self):
         return self.__height
 
-    def show(self):
-        """Displays the picture in a new window."""
+    def show(self, max_size=None):
+        """
+        Displays the picture in a new window.
+
+        If max_size is given as a (width, height) tuple and the picture is
+        bigger than that, a scaled down preview is shown instead. Clicking on
+        the window prints the pixel at that spot in the full size picture.
+        """
         #window = Toplevel()
         window = Tk()
 
         if self.__title is not None:
             window.title(self.__title)
 
-        canvas = Canvas(window, width=self.__width, height=self.__height)
+        # how many picture pixels each preview pixel covers
+        scale = 1
+        if max_size is not None:
+            scale = max(1, self.__width / max_size[0], self.__height / max_size[1])
+
+        view_width = max(1, round(self.__width / scale))
+        view_height = max(1, round(self.__height / scale))
+
+        canvas = Canvas(window, width=view_width, height=view_height)
 
         def print_pixel(event):
-            print(self.get_pixel(event.x, event.y))
+            x = min(int(event.x * scale), self.__width - 1)
+            y = min(int(event.y * scale), self.__height - 1)
+            print(self.get_pixel(x, y))
 
         canvas.bind('<Button-1>', print_pixel) # bind left-click to printing pixel info
         canvas.pack()
 
-        img = self.__get_image(window)
-        canvas.create_image((self.__width/2, self.__height/2), image=img, state="normal")
+        img = self.__get_image(window, view_width, view_height)
+        canvas.create_image((view_width/2, view_height/2), image=img, state="normal")
+
+        window.mainloop()
+
+    def __zoom_region(self, zoom, cx, cy, view_width, view_height):
+        """
+        Works out what show_zoomable draws when the point (cx, cy) of the
+        picture is in the middle of a view_width x view_height window and
+        zoom window pixels show one picture pixel.
+
+        Returns:
+        (type: tuple) - (level, region, place): the pyramid level to draw
+            from, the (x, y, width, height) of the part of that level inside
+            the window, and the (x, y, width, height) it is drawn at in the
+            window. None if no part of the picture is inside the window.
+        """
+        level = self.get_pyramid_level_for(math.ceil(self.__width * zoom),
+                math.ceil(self.__height * zoom))
+        scale = 2 ** level
+
+        region = []
+        place = []
+        for center, size, view_size in ((cx, self.__width, view_width),
+                (cy, self.__height, view_height)):
+            level_size = (size + scale - 1) // scale
+            first = center - view_size / (2 * zoom)
+            last = center + view_size / (2 * zoom)
+            start = max(0, math.floor(first / scale))
+            stop = min(level_size, math.ceil(last / scale))
+            if stop <= start:
+                return None
+
+            view_start = math.floor((start * scale - center) * zoom + view_size / 2)
+            view_stop = math.floor((stop * scale - center) * zoom + view_size / 2)
+            region.append((start, stop - start))
+            place.append((view_start, max(1, view_stop - view_start)))
+
+        (x, width), (y, height) = region
+        (view_x, view_w), (view_y, view_h) = place
+        return (level, (x, y, width, height), (view_x, view_y, view_w, view_h))
+
+    def show_zoomable(self, size=(800, 600)):
+        """
+        Displays the picture in a new window that can be zoomed with the
+        mouse wheel and moved around by dragging it. Clicking (without
+        dragging) prints the pixel at that spot, like show.
+
+        Only the part of the picture inside the window is drawn, from the
+        smallest pyramid level (see get_pyramid_level) with enough detail
+        for the zoom, so even huge pictures stay quick to look around.
+
+        Parameters:
+        size (type: tuple) - The (width, height) of the window.
+        """
+        window = Tk()
+        if self.__title is not None:
+            window.title(self.__title)
+
+        canvas = Canvas(window, width=size[0], height=size[1],
+                background="gray", highlightthickness=0)
+        canvas.pack(fill=BOTH, expand=True)
+
+        # zoom is how many window pixels show one picture pixel; (cx, cy) is
+        # the point of the picture in the middle of the window
+        fit = min(size[0] / max(1, self.__width), size[1] / max(1, self.__height))
+        state = {"zoom": min(1, fit), "cx": self.__width / 2,
+                "cy": self.__height / 2, "drag": None, "image": None}
+        min_zoom, max_zoom = min(1, fit) / 2, 32
+
+        def to_picture(x, y):
+            """Returns the picture point at (x, y) in the window."""
+            return (state["cx"] + (x - canvas.winfo_width() / 2) / state["zoom"],
+                    state["cy"] + (y - canvas.winfo_height() / 2) / state["zoom"])
+
+        def draw(event=None):
+            canvas.delete("all")
+            zoom = state["zoom"]
+            found = self.__zoom_region(zoom, state["cx"], state["cy"],
+                    canvas.winfo_width(), canvas.winfo_height())
+            if found is None:
+                return
+
+            level, region, place = found
+            image = self.get_pyramid_level(level).get_view(*region).get_image()
+            # show single pixels as sharp squares when zoomed in
+            image = image.resize(place[2:],
+                    Image.NEAREST if zoom > 1 else Image.BOX)
+            state["image"] = ImageTk.PhotoImage(image, master=window)
+            canvas.create_image(place[:2], image=state["image"], anchor=NW)
+
+        def zoom_at(event, factor):
+            x, y = to_picture(event.x, event.y)
+            zoom = min(max_zoom, max(min_zoom, state["zoom"] * factor))
+            # keep the point under the mouse where it is
+            state["zoom"] = zoom
+            state["cx"] = x - (event.x - canvas.winfo_width() / 2) / zoom
+            state["cy"] = y - (event.y - canvas.winfo_height() / 2) / zoom
+            draw()
+
+        def press(event):
+            state["drag"] = (event.x, event.y, state["cx"], state["cy"], False)
+
+        def move(event):
+            x, y, cx, cy, moved = state["drag"]
+            state["cx"] = cx - (event.x - x) / state["zoom"]
+            state["cy"] = cy - (event.y - y) / state["zoom"]
+            state["drag"] = (x, y, cx, cy, True)
+            draw()
+
+        def release(event):
+            if state["drag"] is not None and not state["drag"][4]:
+                x, y = to_picture(event.x, event.y)
+                if 0 <= x < self.__width and 0 <= y < self.__height:
+                    print(self.get_pixel(int(x), int(y)))
+            state["drag"] = None
+
+        canvas.bind("<Configure>", draw)
+        canvas.bind("<ButtonPress-1>", press)
+        canvas.bind("<B1-Motion>", move)
+        canvas.bind("<ButtonRelease-1>", release)
+        # Windows and macOS send MouseWheel, X11 sends buttons 4 and 5
+        canvas.bind("<MouseWheel>",
+                lambda event: zoom_at(event, 1.25 if event.delta > 0 else 0.8))
+        canvas.bind("<Button-4>", lambda event: zoom_at(event, 1.25))
+        canvas.bind("<Button-5>", lambda event: zoom_at(event, 0.8))
 
         window.mainloop()
 
     def save(self, filename):
-        """ Saves this picture to a file with the given file name. """
-        img = Image.new('RGB', (self.__width, self.__height), 255)
-        data = img.load()
+        """
+        Saves this picture to a file with the given file name.
 
-        for x in range(self.__width):
-            for y in range(self.__height):
-                data[x,y] = self.get_pixel(x,y).get_rgb()
+        Files ending in RAW_EXTENSION are saved in the raw format (see
+        save_raw).
+        """
+        if str(filename).endswith(RAW_EXTENSION):
+            self.save_raw(filename)
+        else:
+            self.get_image().save(filename)
 
-        img.save(filename)
+    def save_raw(self, filename):
+        """
+        Saves this picture to a file in the uncompressed raw format: a small
+        header (see RAW_HEADER) followed by the RGB bytes, row by row.
 
-    def __get_image(self, win):
-        """Returns this picture as a Tkinter PhotoImage object."""
-        img = PhotoImage(master=win, width=self.__width, height=self.__height)
-        for x in range(self.__width):
-            for y in range(self.__height):
-                curr_pixel = self.__pixels[y][x]
-                img.put("#%02x%02x%02x" % curr_pixel.get_rgb(), (x, y))
+        Raw files are much bigger than PNG or JPEG files, but open_raw can
+        open them instantly.
+        """
+        row_size = self.__width * 3
+        data = memoryview(self.__buffer.data)
+        with open(filename, "wb") as f:
+            f.write(RAW_HEADER.pack(RAW_MAGIC, self.__width, self.__height))
+            if self.is_contiguous():
+                f.write(data)
+            else:
+                for start in self.__row_starts():
+                    f.write(data[start:start + row_size])
+
+    def get_image(self):
+        """
+        Returns this picture as a PIL Image in RGB mode.
+
+        The Image is read straight from the picture's buffer, but PIL copies
+        the pixels as it does (it can only share buffers of 4 bytes a pixel),
+        so changing either one afterwards doesn't change the other.
+        """
+        if self.__stride < 0:
+            # PIL reads the rows from the bottom up when given orientation -1
+            top = self.__offset + (self.__height - 1) * self.__stride
+            return Image.frombuffer("RGB", (self.__width, self.__height),
+                    memoryview(self.__buffer.data)[top:], "raw", "RGB",
+                    -self.__stride, -1)
+
+        return Image.frombuffer("RGB", (self.__width, self.__height),
+                memoryview(self.__buffer.data)[self.__offset:], "raw", "RGB",
+                self.__stride, 1)
+
+    def __get_image(self, win, width=None, height=None):
+        """
+        Returns this picture as a Tkinter PhotoImage object, optionally
+        resized to the given width and height.
+        """
+        image = self.get_image()
+        if (width, height) != (None, None) \
+                and (width, height) != (self.__width, self.__height):
+            image = image.resize((width, height), Image.BOX)
 
-        return img
+        # hand Tk the whole image at once rather than one pixel at a time
+        return ImageTk.PhotoImage(image, master=win)
 
     def __str__(self):
         return "A picture with width = %d and height = %d" % (self.__width,
                 self.__height)
 
+    def __rows(self):
+        """Returns a memoryview of each row of pixels, top to bottom."""
+        row_size = self.__width * 3
+        data = memoryview(self.__buffer.data)
+        return (data[start:start + row_size] for start in self.__row_starts())
+
     def __eq__(self, other):
         """
         Checks for equality of this Picture and another one.
@@ -362,17 +1043,111 @@ class Picture:
         the same. The title of the pictures may differ between equal Picture
         objects though.
         """
-        if self.__width != other.get_width() \
-                or self.__height != other.get_height():
-                    return False
+        if not isinstance(other, Picture):
+            return NotImplemented
+        if self.__width != other.__width or self.__height != other.__height:
+            return False
+
+        if self.__buffer.data is other.__buffer.data \
+                and self.__offset == other.__offset \
+                and self.__stride == other.__stride:
+            # the same pixels (e.g. an unchanged copy)
+            return True
+
+        if self.is_contiguous() and other.is_contiguous():
+            return self.__buffer.data == other.__buffer.data
+
+        # compare a row at a time, stopping at the first difference
+        for row, other_row in zip(self.__rows(), other.__rows()):
+            if row != other_row:
+                return False
+        return True
 
-        # check all individual pixels for equality
-        for x in range(self.__width):
-            for y in range(self.__height):
-                if self.get_pixel(x,y) != other.get_pixel(x,y):
-                    return False
+    def __hash__(self):
+        """
+        Returns a hash of the size and pixels of this picture, so that equal
+        pictures have equal hashes.
 
-        return True
+        Pictures can be changed, so a picture must not be changed while it is
+        used as a dict key or in a set.
+        """
+        return int(self.content_hash()[:16], 16)
+
+    def content_hash(self):
+        """
+        Returns a hash of the size and pixels of this picture (but not its
+        title) as a hex string, e.g. for use as a cache key.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(struct.pack("<II", self.__width, self.__height))
+        if self.is_contiguous():
+            digest.update(self.__buffer.data)
+        else:
+            for row in self.__rows():
+                digest.update(row)
+        return digest.hexdigest()
+
+    def diff(self, other):
+        """
+        Compares the pixels of this picture with another one of the same size.
+
+        Errors are the differences between the red, green and blue values of
+        matching pixels.
+
+        Parameters:
+        other (type: Picture) - The picture to compare with.
+
+        Returns:
+        (type: dict) - With these keys:
+            bbox           - (x, y, width, height) of the smallest rectangle
+                             holding every changed pixel, or None if no pixel
+                             changed.
+            changed_pixels - how many pixels differ.
+            max_error      - the largest error (0 to 255).
+            mean_error     - the average absolute error.
+            mse            - the mean squared error.
+            psnr           - the peak signal-to-noise ratio in decibels
+                             (math.inf if the pictures are equal).
+        """
+        if self.__width != other.get_width() \
+                or self.__height != other.get_height():
+            raise ValueError("can't compare a %dx%d picture with a %dx%d one"
+                    % (self.__width, self.__height, other.get_width(),
+                    other.get_height()))
+        if not isinstance(other, Picture):
+            other = Picture(pic=other)
+
+        changed = max_error = total = squares = 0
+        left, right, top, bottom = self.__width, -1, self.__height, -1
+
+        for y, (row, other_row) in enumerate(zip(self.__rows(), other.__rows())):
+            if row == other_row:
+                continue
+
+            errors = [abs(a - b) for a, b in zip(row, other_row)]
+            pixels = [i // 3 for i in range(0, len(errors), 3)
+                    if errors[i] or errors[i + 1] or errors[i + 2]]
+
+            changed += len(pixels)
+            max_error = max(max_error, max(errors))
+            total += sum(errors)
+            squares += sum(e * e for e in errors)
+            left = min(left, pixels[0])
+            right = max(right, pixels[-1])
+            top = min(top, y)
+            bottom = y
+
+        count = self.__width * self.__height * 3
+        mse = squares / count if count else 0
+        return {
+            "bbox": (left, top, right - left + 1, bottom - top + 1)
+                    if changed else None,
+            "changed_pixels": changed,
+            "max_error": max_error,
+            "mean_error": total / count if count else 0,
+            "mse": mse,
+            "psnr": 10 * math.log10(255 * 255 / mse) if mse else math.inf,
+        }
 
     def __ne__(self, other):
         """
@@ -382,30 +1157,134 @@ class Picture:
         the same. The title of the pictures may differ between equal Picture
         objects though.
         """
-        return not self == other
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
 
     def __iter__(self):
-        """Return new iterator for pixels in this Picture."""
-        self.__iterx = 0
-        self.__itery = 0
-        return self
+        """
+        Returns a new iterator over the pixels in this Picture, row by row.
+
+        Each iterator keeps its own position, so several may be used at once
+        (e.g. in nested loops).
+        """
+        buffer = self.__buffer
+        view = Pixel._view
+        xs = range(self.__width)
+        for y, start in enumerate(self.__row_starts()):
+            for x in xs:
+                yield view(buffer, start + x * 3, x, y)
+
+    def iter_rows(self):
+        """
+        Returns an iterator over the rows of this picture, top to bottom.
 
-    def __next__(self):
-        """Returns the next pixel for iteration."""
-
-        if self.__iterx != (self.__width - 1):
-            # move one column to the right if we can
-            self.__iterx += 1
-            return self.__pixels[self.__itery][self.__iterx]
-        elif self.__itery != (self.__height - 1):
-            # reached right edge, move down a row if we can
-            self.__iterx = 0
-            self.__itery += 1
-            return self.__pixels[self.__itery][self.__iterx]
+        Each row is a read-only memoryview of width * 3 bytes (red, green,
+        blue for each pixel), so no pixels are copied. A row should not be
+        kept after the picture is changed.
+        """
+        for row in self.__rows():
+            yield row.toreadonly()
+
+    def get_row(self, y):
+        """Returns row y of the picture as width * 3 bytes (see iter_rows)."""
+        start = self.__index(0, y) if self.__width else self.__offset
+        return bytes(self.__buffer.data[start:start + self.__width * 3])
+
+    def set_row(self, y, data):
+        """Replaces the pixels of row y with width * 3 bytes of data."""
+        row_size = self.__width * 3
+        if len(data) != row_size:
+            raise ValueError("data must contain exactly width * 3 bytes")
+        if row_size:
+            start = self.__index(0, y)
+            self.__buffer.writable()[start:start + row_size] = data
+
+    def get_channel(self, channel):
+        """
+        Returns one channel of the picture (0 for red, 1 for green, 2 for
+        blue) as width * height bytes, row by row.
+
+        For NumPy arrays of the pixels see filter_engine.to_array.
+        """
+        if channel not in (0, 1, 2):
+            raise ValueError("channel must be 0, 1 or 2")
+        if self.is_contiguous():
+            return bytes(self.__buffer.data[channel::3])
+        return b"".join(bytes(row[channel::3]) for row in self.__rows())
+
+    def set_channel(self, channel, data):
+        """Replaces one channel of the picture (see get_channel)."""
+        if channel not in (0, 1, 2):
+            raise ValueError("channel must be 0, 1 or 2")
+        if len(data) != self.__width * self.__height:
+            raise ValueError("data must contain exactly width * height bytes")
+
+        buffer = self.__buffer.writable()
+        if self.is_contiguous():
+            buffer[channel::3] = data
+            return
+
+        row_size = self.__width * 3
+        for y, start in enumerate(self.__row_starts()):
+            buffer[start + channel:start + row_size:3] = \
+                    data[y * self.__width:(y + 1) * self.__width]
+
+    def apply_lut(self, red, green=None, blue=None):
+        """
+        Changes every channel value v of every pixel to table[v], using a
+        256 entry lookup table for each channel (see the lut module).
+
+        If only red is given, the same table is used for all three channels.
+        """
+        tables = lut.channel_tables(red, green, blue)
+        if self.is_contiguous():
+            self.__buffer.replace(lut.translate(self.__buffer.data, tables))
         else:
-            # reached last pixel: we DONE!
-            raise StopIteration
+            self.set_bytes(lut.translate(self.get_bytes(), tables))
 
+    def map_pixels(self, function, chunk_rows=64, cache=False):
+        """
+        Changes the color of every pixel to function(red, green, blue), which
+        must return an (r, g, b) tuple.
+
+        This is the same as calling set_color on every pixel, but much faster:
+        the pixels are read and written a chunk of rows at a time, and no
+        Pixel or Color objects are made.
+
+        Parameters:
+        function (type: function) - Takes the red, green and blue values of a
+            pixel and returns its new (r, g, b) values.
+        chunk_rows (type: int) - How many rows to process at a time.
+        cache (type: bool) - Whether to remember the result for each color,
+            so that function is only called once per distinct color. Only
+            use this if function always gives the same result for the same
+            color.
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        if cache:
+            function = functools.lru_cache(maxsize=None)(function)
+
+        row_size = self.__width * 3
+        starts = list(self.__row_starts())
+        for first in range(0, self.__height, chunk_rows):
+            chunk_starts = starts[first:first + chunk_rows]
+            data = self.__buffer.data
+            if self.is_contiguous():
+                chunk = bytes(data[chunk_starts[0]:chunk_starts[-1] + row_size])
+            else:
+                chunk = b"".join(data[start:start + row_size]
+                        for start in chunk_starts)
+
+            colors = list(map(function, chunk[0::3], chunk[1::3], chunk[2::3]))
+            result = _color_bytes(colors)
+            if len(result) != len(chunk):
+                raise ValueError("function must return (r, g, b) tuples")
+
+            buffer = self.__buffer.writable()
+            for i, start in enumerate(chunk_starts):
+                buffer[start:start + row_size] = \
+                        result[i * row_size:(i + 1) * row_size]
 
     # camelCase alternative naves
     getPixel = get_pixel
@@ -415,6 +1294,26 @@ class Picture:
     getWidth = get_width
     getHeight = get_height
     setPixel = set_color
+    getBytes = get_bytes
+    setBytes = set_bytes
+    getImage = get_image
+    getView = get_view
+    getFlippedView = get_flipped_view
+    getBuffer = get_buffer
+    isContiguous = is_contiguous
+    saveRaw = save_raw
+    contentHash = content_hash
+    iterRows = iter_rows
+    getRow = get_row
+    setRow = set_row
+    getChannel = get_channel
+    setChannel = set_channel
+    mapPixels = map_pixels
+    applyLUT = apply_lut
+    getPyramidSize = get_pyramid_size
+    getPyramidLevel = get_pyramid_level
+    getPyramidLevelFor = get_pyramid_level_for
+    showZoomable = show_zoomable
 
 
 if __name__ == "__main__":
@@ -0,0 +1,420 @@
+"""
+Module: convolution_engine
+
+Applies convolution kernels of any (odd) size to a Picture.
+
+A kernel is given as a 2D list of numbers, just like the 3x3 kernels used in
+collage_creator. The value of each output pixel is the sum of the kernel
+weights times the neighbouring input pixels, clipped to 0-255:
+
+    out(x, y) = sum of kernel[i][j] * img(x + j - rx, y + i - ry)
+
+where rx and ry are the "radius" of the kernel (e.g. 1 for a 3x3 kernel).
+
+Three methods are used to compute this:
+
+"direct"    - the sum above, for every kernel weight.
+"separable" - kernels like box and Gaussian blurs are the product of a
+              column and a row vector, so two 1-D passes are enough.
+"fft"       - large non-separable kernels are applied with the FFT (needs
+              NumPy).
+"integral"  - large kernels whose weights are all the same (box blurs) are
+              applied with a summed-area table (see integral), which costs
+              the same for any kernel size.
+
+Pixels near the border are handled by one of these border modes:
+
+"skip"    - border pixels are left unchanged.
+"clamp"   - pixels outside the picture repeat the nearest edge pixel.
+"reflect" - pixels outside the picture mirror the picture (without repeating
+            the edge pixel).
+"wrap"    - pixels outside the picture come from the opposite side.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import math
+
+import comp110_image
+import filter_engine
+import integral
+from filter_engine import numpy
+
+BORDER_MODES = ("skip", "clamp", "reflect", "wrap")
+METHODS = ("direct", "separable", "fft", "integral")
+
+# Non-separable kernels at least this wide (or tall) use the FFT when NumPy is
+# available.
+FFT_MIN_SIZE = 11
+
+# Constant kernels at least this wide (or tall) use a summed-area table. Below
+# this the two 1-D passes of the separable method are as fast.
+INTEGRAL_MIN_SIZE = 7
+
+
+def box_kernel(size):
+    """
+    Returns a size x size kernel that averages all of the pixels under it.
+    """
+    weight = 1 / (size * size)
+    return [[weight] * size for _ in range(size)]
+
+
+def gaussian_kernel(size, sigma=None):
+    """
+    Returns a size x size Gaussian blur kernel whose weights add up to 1.
+
+    Parameters:
+    size (type: int) - Width and height of the kernel (must be odd).
+    sigma (type: float) - Standard deviation of the Gaussian. Defaults to a
+        value that suits the kernel size.
+
+    Returns:
+    (type: 2D list of float) - The kernel.
+    """
+    if sigma is None:
+        sigma = 0.3 * ((size - 1) * 0.5 - 1) + 0.8
+
+    r = size // 2
+    weights = [math.exp(-(i * i) / (2 * sigma * sigma)) for i in range(-r, r + 1)]
+    total = sum(weights)
+    weights = [w / total for w in weights]
+    return [[wy * wx for wx in weights] for wy in weights]
+
+
+def check_kernel(kernel):
+    """
+    Checks that kernel is a non-empty rectangular 2D list with an odd number
+    of rows and columns.
+    """
+    rows = len(kernel)
+    cols = len(kernel[0]) if rows > 0 else 0
+    if rows == 0 or cols == 0:
+        raise ValueError("kernel must not be empty")
+    if any(len(row) != cols for row in kernel):
+        raise ValueError("all rows of the kernel must have the same length")
+    if rows % 2 == 0 or cols % 2 == 0:
+        raise ValueError("kernel must have an odd number of rows and columns")
+
+
+def separate(kernel):
+    """
+    Splits a kernel into a column and a row vector, if possible.
+
+    Parameters:
+    kernel (type: 2D list of numbers) - The kernel to split.
+
+    Returns:
+    (type: tuple) - (column, row) such that kernel[i][j] == column[i] * row[j],
+        or None if the kernel is not separable.
+    """
+    # use the largest weight as the pivot to keep things numerically stable
+    pivot_i, pivot_j = 0, 0
+    for i, row in enumerate(kernel):
+        for j, k in enumerate(row):
+            if abs(k) > abs(kernel[pivot_i][pivot_j]):
+                pivot_i, pivot_j = i, j
+
+    pivot = kernel[pivot_i][pivot_j]
+    if pivot == 0:
+        return None
+
+    column = [row[pivot_j] for row in kernel]
+    row = [k / pivot for k in kernel[pivot_i]]
+
+    tolerance = abs(pivot) * 1e-9
+    for i, krow in enumerate(kernel):
+        for j, k in enumerate(krow):
+            if abs(column[i] * row[j] - k) > tolerance:
+                return None
+
+    return column, row
+
+
+def is_constant(kernel):
+    """Returns True if all of the weights of kernel are the same."""
+    first = kernel[0][0]
+    return all(k == first for row in kernel for k in row)
+
+
+def choose_method(kernel, backend=None):
+    """Returns the method convolve will use for kernel if none is given."""
+    size = max(len(kernel), len(kernel[0]))
+    if size >= INTEGRAL_MIN_SIZE and is_constant(kernel):
+        return "integral"
+    if size == 1 or separate(kernel) is not None:
+        return "separable"
+    if size >= FFT_MIN_SIZE and filter_engine.get_backend(backend) == "numpy":
+        return "fft"
+    return "direct"
+
+
+def _border_index(i, n, border):
+    """Maps index i (which may be outside 0 to n-1) to a valid index."""
+    if border == "wrap":
+        return i % n
+    if border == "reflect":
+        if n == 1:
+            return 0
+        i = i % (2 * n - 2)
+        return i if i < n else 2 * n - 2 - i
+    # clamp
+    return min(max(i, 0), n - 1)
+
+
+def padded_indices(n, radius, border):
+    """
+    Returns the list of source indices for a row (or column) of length n
+    padded by radius on both sides with the given border mode.
+
+    With the "skip" border mode nothing is padded.
+    """
+    if border == "skip":
+        return list(range(n))
+    return [_border_index(i, n, border) for i in range(-radius, n + radius)]
+
+
+def _round_and_clip(value):
+    """Returns value rounded to the nearest int and clipped to 0-255."""
+    return min(255, max(0, round(value)))
+
+
+# --- python backend ---------------------------------------------------------
+
+def _correlate_rows(plane, column):
+    """Returns the vertical 1-D pass of the column vector over plane."""
+    out_h = len(plane) - len(column) + 1
+    result = []
+    for y in range(out_h):
+        acc = [0] * len(plane[0])
+        for i, k in enumerate(column):
+            if k:
+                acc = [a + k * s for a, s in zip(acc, plane[y + i])]
+        result.append(acc)
+    return result
+
+
+def _correlate_columns(plane, row):
+    """Returns the horizontal 1-D pass of the row vector over plane."""
+    out_w = len(plane[0]) - len(row) + 1
+    result = []
+    for src in plane:
+        acc = [0] * out_w
+        for j, k in enumerate(row):
+            if k:
+                acc = [a + k * s for a, s in zip(acc, src[j:j + out_w])]
+        result.append(acc)
+    return result
+
+
+def _correlate_direct(plane, kernel):
+    """Returns the full 2-D correlation of kernel over plane (valid part)."""
+    out_h = len(plane) - len(kernel) + 1
+    out_w = len(plane[0]) - len(kernel[0]) + 1
+    result = []
+    for y in range(out_h):
+        acc = [0] * out_w
+        for i, krow in enumerate(kernel):
+            src = plane[y + i]
+            for j, k in enumerate(krow):
+                if k:
+                    acc = [a + k * s for a, s in zip(acc, src[j:j + out_w])]
+        result.append(acc)
+    return result
+
+
+def _convolve_python(img, kernel, border, method):
+    """Returns the convolved pixels of img as bytes, using only Python."""
+    width, height = img.getWidth(), img.getHeight()
+    ry, rx = len(kernel) // 2, len(kernel[0]) // 2
+    data = img.getBytes()
+    result = bytearray(data)
+
+    row_idx = padded_indices(height, ry, border)
+    col_idx = padded_indices(width, rx, border)
+
+    if border == "skip":
+        # only pixels with the whole kernel inside the picture are changed
+        out_x, out_y = rx, ry
+        out_w, out_h = width - 2 * rx, height - 2 * ry
+    else:
+        out_x, out_y, out_w, out_h = 0, 0, width, height
+    if out_w <= 0 or out_h <= 0:
+        return result
+
+    if method == "separable":
+        column, row = separate(kernel)
+
+    for c in range(3):
+        channel = data[c::3]
+        plane = [[channel[y * width + x] for x in col_idx] for y in row_idx]
+
+        if method == "separable":
+            filtered = _correlate_columns(_correlate_rows(plane, column), row)
+        else:
+            filtered = _correlate_direct(plane, kernel)
+
+        for y, values in enumerate(filtered):
+            start = ((out_y + y) * width + out_x) * 3 + c
+            result[start:start + out_w * 3:3] = bytes(map(_round_and_clip, values))
+
+    return result
+
+
+# --- summed-area table -------------------------------------------------------
+
+def _padded_picture(img, rx, ry, border, backend):
+    """Returns a copy of img padded by rx and ry pixels with the border mode."""
+    width = img.getWidth()
+    col_idx = padded_indices(width, rx, border)
+    row_idx = padded_indices(img.getHeight(), ry, border)
+
+    if backend == "numpy":
+        src = filter_engine.to_array(img)
+        return filter_engine.from_array(src[numpy.ix_(row_idx, col_idx)])
+
+    data = img.getBytes()
+    # gather the padded columns of every row at once, one channel at a time
+    columns = bytearray(len(col_idx) * 3)
+    rows = [data[y * width * 3:(y + 1) * width * 3] for y in range(img.getHeight())]
+    padded = []
+    for y in row_idx:
+        row = rows[y]
+        for c in range(3):
+            columns[c::3] = bytes(map(row[c::3].__getitem__, col_idx))
+        padded.append(bytes(columns))
+
+    return comp110_image.Picture(len(col_idx), len(row_idx), data=b"".join(padded))
+
+
+def _convolve_integral(img, kernel, border, backend):
+    """
+    Returns the convolved pixels of img as bytes, for a kernel whose weights
+    are all the same.
+    """
+    width, height = img.getWidth(), img.getHeight()
+    kh, kw = len(kernel), len(kernel[0])
+    weight = kernel[0][0]
+
+    if border != "skip":
+        padded = _padded_picture(img, kw // 2, kh // 2, border, backend)
+        return integral.box_filter(padded, kw, kh, weight, backend)
+
+    # only pixels with the whole kernel inside the picture are changed; the
+    # summed-area table of img itself is used (and cached for later)
+    result = bytearray(img.getBytes())
+    values = integral.box_filter(img, kw, kh, weight, backend)
+    out_w = width - kw + 1
+    if values:
+        row_size = out_w * 3
+        for y in range(height - kh + 1):
+            start = ((y + kh // 2) * width + kw // 2) * 3
+            result[start:start + row_size] = values[y * row_size:(y + 1) * row_size]
+    return result
+
+
+# --- numpy backend ----------------------------------------------------------
+
+def _correlate_fft(plane, kernel):
+    """Returns the valid part of the correlation of kernel over plane."""
+    kh, kw = kernel.shape
+    shape = plane.shape
+    spectrum = numpy.fft.rfft2(plane) * numpy.fft.rfft2(kernel[::-1, ::-1], s=shape)
+    full = numpy.fft.irfft2(spectrum, s=shape)
+    return full[kh - 1:, kw - 1:]
+
+
+def _convolve_numpy(img, kernel, border, method):
+    """Returns the convolved pixels of img as bytes, using NumPy."""
+    width, height = img.getWidth(), img.getHeight()
+    k = numpy.array(kernel, dtype=numpy.float64)
+    kh, kw = k.shape
+
+    src = filter_engine.to_array(img)
+    result = src.copy()
+    padded = src[numpy.ix_(padded_indices(height, kh // 2, border),
+            padded_indices(width, kw // 2, border))].astype(numpy.float64)
+
+    out_h = padded.shape[0] - kh + 1
+    out_w = padded.shape[1] - kw + 1
+    if out_h <= 0 or out_w <= 0:
+        return result.tobytes()
+
+    if method == "separable":
+        column, row = separate(kernel)
+        tmp = numpy.zeros((out_h, padded.shape[1], 3))
+        for i, weight in enumerate(column):
+            if weight:
+                tmp += weight * padded[i:i + out_h]
+        out = numpy.zeros((out_h, out_w, 3))
+        for j, weight in enumerate(row):
+            if weight:
+                out += weight * tmp[:, j:j + out_w]
+    elif method == "fft":
+        out = numpy.stack([_correlate_fft(padded[:, :, c], k) for c in range(3)],
+                axis=2)
+    else:
+        out = numpy.zeros((out_h, out_w, 3))
+        for i in range(kh):
+            for j in range(kw):
+                if k[i, j]:
+                    out += k[i, j] * padded[i:i + out_h, j:j + out_w]
+
+    out = numpy.clip(numpy.rint(out), 0, 255).astype(numpy.uint8)
+    if border == "skip":
+        result[kh // 2:kh // 2 + out_h, kw // 2:kw // 2 + out_w] = out
+    else:
+        result = out
+
+    return result.tobytes()
+
+
+def convolve(img, kernel, border="skip", method=None, backend=None, out=None):
+    """
+    Returns a copy of img with the given kernel applied to every pixel.
+
+    Parameters:
+    img (type: Picture) - The original (unmodified) picture.
+    kernel (type: 2D list of numbers) - The kernel to apply. It may be any
+        size, as long as it has an odd number of rows and columns.
+    border (type: str) - How to handle pixels near the border (see
+        BORDER_MODES).
+    method (type: str or None) - "direct", "separable", "fft" or "integral".
+        If None, the fastest method for the kernel is picked.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (see
+        filter_engine.make_result). It must not share pixels with img.
+
+    Returns:
+    (type: Picture) - The filtered picture.
+    """
+    check_kernel(kernel)
+    if border not in BORDER_MODES:
+        raise ValueError("border must be one of %s, not %r" % (BORDER_MODES, border))
+
+    backend = filter_engine.get_backend(backend)
+    if method is None:
+        method = choose_method(kernel, backend)
+    if method not in METHODS:
+        raise ValueError("method must be one of %s, not %r" % (METHODS, method))
+    if method == "separable" and separate(kernel) is None:
+        raise ValueError("kernel is not separable")
+    if method == "fft" and backend != "numpy":
+        raise ValueError("the fft method requires the numpy backend")
+    if method == "integral" and not is_constant(kernel):
+        raise ValueError("the integral method requires a constant kernel")
+
+    filter_engine.check_output(img, out)
+    if img.getWidth() == 0 or img.getHeight() == 0:
+        return filter_engine.make_result(img, b"", out)
+
+    if method == "integral":
+        data = _convolve_integral(img, kernel, border, backend)
+    elif backend == "numpy":
+        data = _convolve_numpy(img, kernel, border, method)
+    else:
+        data = _convolve_python(img, kernel, border, method)
+
+    return filter_engine.make_result(img, data, out)
@@ -43,3 +43,10 @@ def negative(img):
             pix.setGreen(255 - pix.getGreen())
             pix.setBlue(255 - pix.getBlue())
 
+
+def negative_mapped(img):
+    """
+    Applies the 'negative' filter to img, like negative, but using
+    map_pixels so that it runs much faster.
+    """
+    img.mapPixels(lambda red, green, blue: (255 - red, 255 - green, 255 - blue))
@@ -0,0 +1,333 @@
+"""
+Module: filter_engine
+
+Whole-image versions of the collage filters.
+
+Every filter here works on the entire pixel buffer of a Picture at once
+instead of visiting pixels one at a time. Two backends are available:
+
+"python" - uses only built-in bytes operations (no extra packages needed).
+"numpy"  - uses NumPy array operations.
+
+Both backends produce byte-for-byte identical output, so they can be compared
+against each other.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import comp110_image
+import lut
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BACKENDS = ("python", "numpy")
+
+# Backend used when a filter is not given one explicitly.
+DEFAULT_BACKEND = "numpy" if numpy is not None else "python"
+
+
+def get_backend(backend=None):
+    """
+    Returns the name of the backend to use.
+
+    Parameters:
+    backend (type: str or None) - The requested backend, or None for
+        DEFAULT_BACKEND.
+
+    Returns:
+    (type: str) - Either "python" or "numpy".
+    """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+
+    if backend not in BACKENDS:
+        raise ValueError("backend must be one of %s, not %r" % (BACKENDS, backend))
+    if backend == "numpy" and numpy is None:
+        raise ImportError("the numpy backend requires NumPy to be installed")
+
+    return backend
+
+
+def to_array(img, writable=False):
+    """
+    Returns the pixels of img as a NumPy uint8 array of shape (height, width, 3).
+
+    No pixels are copied: the array shares img's buffer (this works for views
+    too). The array may only be changed if writable is True, in which case
+    changing it changes the picture.
+    """
+    data, offset, stride = img.getBuffer(writable)
+    return numpy.ndarray((img.getHeight(), img.getWidth(), 3), numpy.uint8,
+            buffer=data, offset=offset, strides=(stride, 3, 1))
+
+
+def check_output(img, out, size=None):
+    """
+    Raises a ValueError if out is not the same size as img (or, if given,
+    the (width, height) tuple size).
+    """
+    if size is None:
+        size = (img.getWidth(), img.getHeight())
+    if out is not None and (out.getWidth(), out.getHeight()) != tuple(size):
+        raise ValueError("output picture must be %dx%d, not %dx%d"
+                % (size[0], size[1], out.getWidth(), out.getHeight()))
+
+
+def from_array(arr, title=None, out=None):
+    """
+    Returns a Picture with the pixels in the (height, width, 3) array arr.
+
+    If out is given, the pixels are written straight into it (it may be a
+    view of a bigger picture) and out is returned. Otherwise a new Picture is
+    created.
+    """
+    height, width = arr.shape[0], arr.shape[1]
+    if out is not None:
+        if (out.getWidth(), out.getHeight()) != (width, height):
+            raise ValueError("output picture must be %dx%d" % (width, height))
+        to_array(out, True)[...] = arr
+        return out
+
+    data = numpy.ascontiguousarray(arr, dtype=numpy.uint8).tobytes()
+    return comp110_image.Picture(width, height, title=title, data=data)
+
+
+def make_result(img, data, out=None, size=None):
+    """
+    Returns a Picture the same size (and title) as img with the given bytes.
+
+    size is the (width, height) of the result if it is not img's size (e.g.
+    after resizing or rotating). If out is given, the bytes are written
+    straight into it and out is returned. Otherwise a new Picture is
+    created.
+    """
+    if size is None:
+        size = (img.getWidth(), img.getHeight())
+    if out is not None:
+        check_output(img, out, size)
+        out.setBytes(data)
+        return out
+
+    return comp110_image.Picture(size[0], size[1], title=img.getTitle(),
+            data=data)
+
+
+def brightness_table(factor):
+    """
+    Returns a 256 byte lookup table that scales a channel value by factor.
+
+    Results are truncated to an int and clipped to the range 0 to 255.
+    """
+    return lut.brightness(factor)
+
+
+def point(img, red, green=None, blue=None, backend=None, out=None):
+    """
+    Returns a copy of img with a lookup table applied to each channel (see
+    the lut module).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    red (type: bytes) - The 256 entry table for the red channel.
+    green (type: bytes or None) - The table for green (red's if None).
+    blue (type: bytes or None) - The table for blue (red's if None).
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The changed picture.
+    """
+    tables = lut.channel_tables(red, green, blue)
+    if get_backend(backend) == "numpy":
+        lookup = numpy.frombuffer(b"".join(tables), numpy.uint8).reshape(3, 256)
+        if tables[0] == tables[1] == tables[2]:
+            arr = lookup[0][to_array(img)]
+        else:
+            arr = lookup[numpy.arange(3), to_array(img)]
+        return from_array(arr, img.getTitle(), out)
+
+    if img.isContiguous():
+        # translate straight from the picture's buffer
+        data = img.getBuffer()[0]
+    else:
+        data = img.getBytes()
+    return make_result(img, lut.translate(data, tables), out)
+
+
+def brightness(img, factor, backend=None, out=None):
+    """
+    Returns a copy of img with every channel multiplied by factor.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    factor (type: float) - How much to scale each channel value by.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The brightened (or darkened) picture.
+    """
+    return point(img, lut.brightness(factor), backend=backend, out=out)
+
+
+def grayscale(img, backend=None, out=None):
+    """
+    Returns a copy of img where each pixel is set to the average of its
+    red, green, and blue values.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The gray picture.
+    """
+    if get_backend(backend) == "numpy":
+        gray = to_array(img).sum(axis=2, dtype=numpy.uint16) // 3
+        arr = numpy.repeat(gray.astype(numpy.uint8)[:, :, None], 3, axis=2)
+        return from_array(arr, img.getTitle(), out)
+
+    data = img.getBytes()
+    gray = bytes(map(lambda r, g, b: (r + g + b) // 3,
+            data[0::3], data[1::3], data[2::3]))
+
+    result = bytearray(len(data))
+    result[0::3] = gray
+    result[1::3] = gray
+    result[2::3] = gray
+    return make_result(img, result, out)
+
+
+def _reverse_rows(data, row_size):
+    """Returns the rows of the RGB bytes in data in reverse order."""
+    rows = [data[i:i + row_size] for i in range(0, len(data), row_size)]
+    return b"".join(reversed(rows))
+
+
+def _reverse_columns(data, row_size):
+    """Returns the RGB bytes in data with each row's pixels in reverse order."""
+    result = bytearray(len(data))
+    for start in range(0, len(data), row_size):
+        end = start + row_size
+        row = data[start:end]
+        # reverse the order of the pixels, but not of the channels in a pixel
+        result[start:end:3] = row[-3::-3]
+        result[start + 1:end:3] = row[-2::-3]
+        result[start + 2:end:3] = row[-1::-3]
+    return result
+
+
+def flip_vertical(img, backend=None, out=None):
+    """
+    Returns a copy of img that is flipped upside down (top row at the bottom).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The flipped picture.
+    """
+    if get_backend(backend) == "numpy":
+        return from_array(to_array(img)[::-1], img.getTitle(), out)
+
+    data = img.getBytes()
+    if not data:
+        return make_result(img, data, out)
+
+    return make_result(img, _reverse_rows(data, img.getWidth() * 3), out)
+
+
+def flip_horizontal(img, backend=None, out=None):
+    """
+    Returns a copy of img that is flipped left to right.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The flipped picture.
+    """
+    if get_backend(backend) == "numpy":
+        return from_array(to_array(img)[:, ::-1], img.getTitle(), out)
+
+    data = img.getBytes()
+    if not data:
+        return make_result(img, data, out)
+
+    return make_result(img, _reverse_columns(data, img.getWidth() * 3), out)
+
+
+def mirror_vertical(img, backend=None, out=None):
+    """
+    Returns a copy of img where the bottom half is replaced by a mirror image
+    of the top half (i.e. the image is mirrored over the x axis).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The mirrored picture.
+    """
+    half = img.getHeight() // 2
+    keep = img.getHeight() - half
+
+    if get_backend(backend) == "numpy":
+        arr = to_array(img).copy()
+        arr[keep:] = arr[:half][::-1]
+        return from_array(arr, img.getTitle(), out)
+
+    data = img.getBytes()
+    if not data:
+        return make_result(img, data, out)
+
+    row_size = img.getWidth() * 3
+    top = data[:half * row_size]
+    result = data[:keep * row_size] + _reverse_rows(top, row_size)
+    return make_result(img, result, out)
+
+
+def mirror_horizontal(img, backend=None, out=None):
+    """
+    Returns a copy of img where the right half is replaced by a mirror image
+    of the left half (i.e. the image is mirrored over the y axis).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - Which backend to use.
+    out (type: Picture or None) - Where to write the result (see make_result).
+
+    Returns:
+    (type: Picture) - The mirrored picture.
+    """
+    half = img.getWidth() // 2
+    keep = img.getWidth() - half
+
+    if get_backend(backend) == "numpy":
+        arr = to_array(img).copy()
+        arr[:, keep:] = arr[:, :half][:, ::-1]
+        return from_array(arr, img.getTitle(), out)
+
+    data = img.getBytes()
+    if not data:
+        return make_result(img, data, out)
+
+    row_size = img.getWidth() * 3
+    flipped = _reverse_columns(data, row_size)
+    result = bytearray(data)
+    for start in range(0, len(data), row_size):
+        # the right half of a flipped row is the reversed left half
+        result[start + keep * 3:start + row_size] = \
+                flipped[start + keep * 3:start + row_size]
+    return make_result(img, result, out)
@@ -0,0 +1,259 @@
+"""
+Module: image_cache
+
+An on-disk cache of decoded, shrunk and filtered pictures.
+
+Entries are keyed by a hash of the source file's contents plus the name and
+parameters of whatever was done to it (and CACHE_VERSION), so a changed
+source file or a changed parameter simply gets a new key, and anything that
+didn't change is reused.
+
+Each entry is stored in the raw picture format (see comp110_image.open_raw),
+so reading it back is just a memory map, with no decoding or copying. The
+cache is kept under a size limit by deleting the least recently used
+entries.
+
+Example:
+    cache = ImageCache("collage_cache", max_bytes=500 * 1024 * 1024)
+    collage = create_collage("tiger.jpg", 900, 600, cache)
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import collage_creator
+import comp110_image
+import resample
+
+# Part of every key. Change it whenever the way a cached picture is made
+# changes (e.g. a filter's code or the raw format), so old entries are
+# never used again.
+CACHE_VERSION = 1
+
+# Default size limit of the cache (1 GB)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_EXTENSION = comp110_image.RAW_EXTENSION
+
+# When put has to evict, it shrinks the cache to this fraction of its limit,
+# so the next few puts don't have to scan the directory again.
+EVICT_TO_FRACTION = 0.9
+
+# Temporary files older than this (in seconds) were left behind by a writer
+# that died, rather than being written right now, and are deleted by evict.
+STALE_TEMP_SECONDS = 60 * 60
+
+
+def file_hash(filename):
+    """Returns the SHA-256 hash of a file's contents, as a hex string."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """A directory of cached pictures with a total size limit."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        # file hashes we have already computed: (path, size, mtime) -> hash
+        self.__hashes = {}
+        # roughly how many bytes the cache holds (None until the first scan);
+        # other processes may add to it too, so it is only used to decide
+        # when to scan the directory again
+        self.__size_estimate = None
+        os.makedirs(directory, exist_ok=True)
+
+    def get_directory(self):
+        return self.__directory
+
+    def source_hash(self, filename):
+        """
+        Returns the content hash of a source file. It is only recomputed if
+        the file's size or modification time has changed.
+        """
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if key not in self.__hashes:
+            self.__hashes[key] = file_hash(filename)
+        return self.__hashes[key]
+
+    def make_key(self, filename, name, params=None):
+        """
+        Returns the cache key for the result of applying the operation called
+        name, with the given parameters (a JSON-serializable dict), to the
+        source file filename.
+        """
+        description = json.dumps([CACHE_VERSION, self.source_hash(filename),
+                name, params or {}], sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.__directory, key + _EXTENSION)
+
+    def get(self, key):
+        """Returns the cached Picture for key, or None if it isn't cached."""
+        path = self.__path(key)
+        try:
+            pic = comp110_image.open_raw(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # it was evicted (perhaps by another process) in the meantime
+            return None
+        return pic
+
+    def put(self, key, pic):
+        """
+        Stores pic in the cache under key, evicting old entries if the cache
+        may have grown past its size limit.
+        """
+        # write to a temporary file first so other processes never see a
+        # half-written entry
+        fd, tmp = tempfile.mkstemp(dir=self.__directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            pic.save_raw(tmp)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self.__path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        # the directory is only scanned when the estimate says it is needed
+        if self.__size_estimate is not None:
+            self.__size_estimate += size
+        if self.__size_estimate is None \
+                or self.__size_estimate > self.__max_bytes:
+            self.evict(int(self.__max_bytes * EVICT_TO_FRACTION))
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached Picture for key. If it isn't cached, compute() is
+        called to make it and the result is cached.
+        """
+        pic = self.get(key)
+        if pic is None:
+            pic = compute()
+            self.put(key, pic)
+        return pic
+
+    def evict(self, max_bytes=None):
+        """
+        Deletes the least recently used entries until the cache is no bigger
+        than max_bytes (the cache's own limit if None).
+
+        Temporary files left behind by writers that died (see
+        STALE_TEMP_SECONDS) are deleted too.
+        """
+        if max_bytes is None:
+            max_bytes = self.__max_bytes
+
+        entries = []
+        total = 0
+        stale = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(self.__directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(_EXTENSION):
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+                elif entry.name.endswith(".tmp") and stat.st_mtime < stale:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self.__size_estimate = total
+
+    def clear(self):
+        """Deletes every entry in the cache."""
+        self.evict(0)
+
+    def load(self, filename):
+        """Returns the decoded picture in filename, decoding it only once."""
+        key = self.make_key(filename, "decode")
+        return self.get_or_compute(key,
+                lambda: comp110_image.Picture(filename=filename))
+
+    def load_fit(self, filename, max_w, max_h, method="area"):
+        """
+        Returns resample.load_fit(filename, max_w, max_h, method), computing
+        it only once.
+        """
+        key = self.make_key(filename, "load_fit",
+                {"max": [max_w, max_h], "method": method})
+        return self.get_or_compute(key,
+                lambda: resample.load_fit(filename, max_w, max_h, method))
+
+    # camelCase alternative names
+    getDirectory = get_directory
+    getOrCompute = get_or_compute
+    loadFit = load_fit
+
+
+def create_collage(image_filename, max_w, max_h, cache, backend=None,
+        shrink_pic=None):
+    """
+    Creates a collage like collage_creator.create_collage, reusing every
+    shrunk and filtered picture that is already in the cache.
+
+    The picture is shrunk by resample.load_fit, the same as when no cache is
+    used, so the collage is the same either way.
+
+    Parameters:
+    image_filename (type: str) - The picture to make a collage of.
+    max_w (type: int) - The maximum width of the collage.
+    max_h (type: int) - The maximum height of the collage.
+    cache (type: ImageCache) - Where to look for and store pictures.
+    backend (type: str) - "python" or "numpy" (see filter_engine). This does
+        not change the results, so it isn't part of the keys.
+    shrink_pic (type: Picture) - The shrunk picture, if it was already
+        loaded with cache.load_fit(image_filename, max_w // 3, max_h // 2).
+
+    Returns:
+    (type: Picture) - The collage.
+    """
+    if shrink_pic is None:
+        shrink_pic = cache.load_fit(image_filename, max_w // 3, max_h // 2)
+    tile_w, tile_h = shrink_pic.getWidth(), shrink_pic.getHeight()
+
+    params = {"max": [max_w // 3, max_h // 2], "method": "area"}
+    collage = comp110_image.Picture(tile_w * 3, tile_h * 2)
+    tiles = collage_creator.collage_tiles(collage, tile_w, tile_h)
+    for i, tile in enumerate(tiles):
+        # keyed by the filter's name, not its place in the collage
+        filter_params = dict(params, filter=collage_creator.FILTER_NAMES[i])
+        key = cache.make_key(image_filename, "collage_filter", filter_params)
+        filtered = cache.get_or_compute(key,
+                lambda: collage_creator.apply_collage_filter(i, shrink_pic, backend))
+        tile.setBytes(filtered.getBytes())
+
+    return collage
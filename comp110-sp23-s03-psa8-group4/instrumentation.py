@@ -0,0 +1,214 @@
+"""
+Module: instrumentation
+
+Opt-in measurements of the stages of the collage pipeline (loading,
+shrinking, each filter, assembling, saving).
+
+Code marks a stage with:
+
+    with instrumentation.stage("load") as record:
+        pic = comp110_image.Picture(filename=filename)
+        record["pixels"] = pic.getWidth() * pic.getHeight()
+
+Nothing is measured unless a listener has been added. Each listener is
+called with a record (a dict) for every stage that finishes:
+
+    name      - the name of the stage
+    kind      - "stage", or "event" for single moments (see event)
+    start     - when the stage started (time.perf_counter(), in seconds)
+    wall      - seconds the stage took
+    cpu       - CPU seconds the stage's thread used
+    pixels    - how many pixels the stage processed (0 if not given)
+    allocated - net bytes allocated by Python during the stage, or None if
+                tracemalloc isn't tracing
+    thread    - id of the thread the stage ran in
+    args      - any other values given to stage or event
+
+Recorder is a listener that keeps the records, sums them up and can write
+them as a trace-event file for a timeline viewer (chrome://tracing or
+https://ui.perfetto.dev):
+
+    with instrumentation.Recorder(allocations=True) as recorder:
+        collage_creator.create_collage(pic, 900, 600)
+    print(recorder.summary())
+    recorder.write_trace("collage_trace.json")
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Functions called with the record of every finished stage
+_listeners = []
+
+
+def add_listener(listener):
+    """Starts calling listener(record) for every finished stage."""
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Stops calling listener."""
+    _listeners.remove(listener)
+
+
+def is_enabled():
+    """Returns True if anything is listening for stages."""
+    return bool(_listeners)
+
+
+def _notify(record):
+    for listener in list(_listeners):
+        listener(record)
+
+
+@contextlib.contextmanager
+def stage(name, pixels=0, **args):
+    """
+    Measures the code in a with block as the stage called name.
+
+    Parameters:
+    name (type: str) - Name of the stage.
+    pixels (type: int) - How many pixels the stage processes. It may also be
+        set later through the record given by the with statement.
+    args - Any other values to add to the record.
+
+    Returns:
+    (type: dict) - The record being filled in (given by the with statement).
+    """
+    record = {"name": name, "kind": "stage", "pixels": pixels, "args": args}
+    if not _listeners:
+        yield record
+        return
+
+    tracing = tracemalloc.is_tracing()
+    memory = tracemalloc.get_traced_memory()[0] if tracing else None
+    cpu = time.thread_time()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall"] = time.perf_counter() - start
+        record["cpu"] = time.thread_time() - cpu
+        record["start"] = start
+        record["thread"] = threading.get_ident()
+        if tracing and tracemalloc.is_tracing():
+            record["allocated"] = tracemalloc.get_traced_memory()[0] - memory
+        else:
+            record["allocated"] = None
+        _notify(record)
+
+
+def event(name, **args):
+    """Records a single moment (e.g. a value that was chosen) called name."""
+    if _listeners:
+        _notify({"name": name, "kind": "event", "start": time.perf_counter(),
+                "wall": 0, "cpu": 0, "pixels": 0, "allocated": None,
+                "thread": threading.get_ident(), "args": args})
+
+
+class Recorder:
+    """
+    A listener that keeps every record it is given.
+
+    Use it in a with statement to listen only for the code in the block.
+    """
+
+    def __init__(self, allocations=False):
+        """
+        Parameters:
+        allocations (type: bool) - Whether to start tracemalloc (while used in
+            a with statement) so that allocations are measured. This slows
+            everything down noticeably.
+        """
+        self.__records = []
+        self.__lock = threading.Lock()
+        self.__allocations = allocations
+        self.__started_tracing = False
+
+    def __call__(self, record):
+        with self.__lock:
+            self.__records.append(record)
+
+    def get_records(self):
+        """Returns a list of the records so far."""
+        with self.__lock:
+            return list(self.__records)
+
+    def clear(self):
+        with self.__lock:
+            self.__records = []
+
+    def summary(self):
+        """
+        Returns the totals for each stage name: a dict mapping the name to a
+        dict with the number of calls and total wall, cpu, pixels and
+        allocated, plus megapixels_per_second.
+        """
+        totals = {}
+        for record in self.get_records():
+            if record["kind"] != "stage":
+                continue
+            total = totals.setdefault(record["name"], {"calls": 0, "wall": 0,
+                    "cpu": 0, "pixels": 0, "allocated": None})
+            total["calls"] += 1
+            total["wall"] += record["wall"]
+            total["cpu"] += record["cpu"]
+            total["pixels"] += record["pixels"]
+            if record["allocated"] is not None:
+                total["allocated"] = (total["allocated"] or 0) + record["allocated"]
+
+        for total in totals.values():
+            total["megapixels_per_second"] = total["pixels"] / 1e6 / total["wall"] \
+                    if total["wall"] > 0 else None
+        return totals
+
+    def get_trace_events(self):
+        """Returns the records in the Trace Event Format, as a list of dicts."""
+        pid = os.getpid()
+        events = []
+        for record in self.get_records():
+            args = dict(record["args"], pixels=record["pixels"],
+                    cpu_ms=record["cpu"] * 1000)
+            if record["allocated"] is not None:
+                args["allocated"] = record["allocated"]
+
+            event = {"name": record["name"], "pid": pid, "tid": record["thread"],
+                    "ts": record["start"] * 1e6, "args": args}
+            if record["kind"] == "stage":
+                event.update(ph="X", dur=record["wall"] * 1e6)
+            else:
+                event.update(ph="i", s="t")
+            events.append(event)
+        return events
+
+    def write_trace(self, filename):
+        """Writes the records to a trace-event (JSON) file."""
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.get_trace_events(),
+                    "displayTimeUnit": "ms"}, f)
+
+    def __enter__(self):
+        if self.__allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+        add_listener(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_listener(self)
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    # camelCase alternative names
+    getRecords = get_records
+    getTraceEvents = get_trace_events
+    writeTrace = write_trace
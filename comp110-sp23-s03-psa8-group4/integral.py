@@ -0,0 +1,449 @@
+"""
+Module: integral
+
+Summed-area tables ("integral images") and the filters they make fast.
+
+The summed-area table S of a picture holds, for every (x, y), the sum of
+the channel values of all pixels above and to the left of it:
+
+    S[y][x] = sum of img(i, j) for all i < x, j < y
+
+so the sum of any rectangle of pixels takes just four lookups:
+
+    sum of x1 <= i < x2, y1 <= j < y2 = S[y2][x2] - S[y1][x2]
+                                        - S[y2][x1] + S[y1][x1]
+
+Building the table takes one pass over the picture. After that a box blur
+or an area-averaging shrink costs the same for every output pixel, however
+big the box is. The table is cached on the picture (see Picture.cached),
+so several blurs or shrinks of the same picture only build it once.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import itertools
+import math
+import operator
+from array import array
+
+import filter_engine
+from filter_engine import numpy
+
+
+# --- building tables ----------------------------------------------------------
+
+def _table_python(img):
+    """
+    Returns the summed-area table of img as a tuple of one table per
+    channel, each a list of height + 1 rows of width + 1 ints.
+    """
+    width, height = img.getWidth(), img.getHeight()
+    tables = []
+    for c in range(3):
+        channel = img.getChannel(c)
+        row = array("q", bytes(8 * (width + 1)))
+        table = [row]
+        for y in range(height):
+            sums = itertools.accumulate(channel[y * width:(y + 1) * width],
+                    initial=0)
+            row = array("q", map(operator.add, row, sums))
+            table.append(row)
+        tables.append(table)
+    return tuple(tables)
+
+
+def _table_numpy(img):
+    """
+    Returns the summed-area table of img as an int64 array of shape
+    (height + 1, width + 1, 3).
+    """
+    arr = filter_engine.to_array(img)
+    table = numpy.zeros((img.getHeight() + 1, img.getWidth() + 1, 3),
+            numpy.int64)
+    numpy.cumsum(numpy.cumsum(arr, axis=0, dtype=numpy.int64), axis=1,
+            out=table[1:, 1:])
+    return table
+
+
+def summed_area_table(img, backend=None):
+    """
+    Returns the summed-area table of img, building it only if the picture
+    changed since it was last built.
+
+    Parameters:
+    img (type: Picture) - The picture.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+
+    Returns:
+    With the numpy backend, an int64 array of shape (height + 1, width + 1,
+    3). With the python backend, a (red, green, blue) tuple of tables, each a
+    list of height + 1 rows of width + 1 ints.
+    """
+    backend = filter_engine.get_backend(backend)
+    if backend == "numpy":
+        return img.cached("summed_area_table_numpy", _table_numpy)
+    return img.cached("summed_area_table_python", _table_python)
+
+
+# --- box sums -----------------------------------------------------------------
+
+def _boxes_python(tables, xs1, xs2, ys1, ys2, value):
+    """
+    Returns the RGB bytes of a len(xs1) x len(ys1) picture, where pixel
+    (i, j) is value(sum, count) of the box xs1[i] <= x < xs2[i],
+    ys1[j] <= y < ys2[j].
+    """
+    width = len(xs1)
+    widths = [x2 - x1 for x1, x2 in zip(xs1, xs2)]
+    result = bytearray(width * len(ys1) * 3)
+
+    for c, table in enumerate(tables):
+        for j, (y1, y2) in enumerate(zip(ys1, ys2)):
+            top, bottom = table[y1], table[y2]
+            sums = map(lambda a, b, d, e: a - b - d + e,
+                    map(bottom.__getitem__, xs2), map(top.__getitem__, xs2),
+                    map(bottom.__getitem__, xs1), map(top.__getitem__, xs1))
+            counts = [w * (y2 - y1) for w in widths]
+
+            start = j * width * 3 + c
+            result[start:start + width * 3:3] = bytes(map(value, sums, counts))
+
+    return result
+
+
+def _boxes_numpy(table, xs1, xs2, ys1, ys2):
+    """
+    Returns (sums, counts) for the boxes described in _boxes_python, as
+    arrays of shape (len(ys1), len(xs1), 3) and (len(ys1), len(xs1), 1).
+    """
+    xs1, xs2 = numpy.asarray(xs1), numpy.asarray(xs2)
+    ys1, ys2 = numpy.asarray(ys1), numpy.asarray(ys2)
+    sums = table[numpy.ix_(ys2, xs2)] - table[numpy.ix_(ys1, xs2)] \
+            - table[numpy.ix_(ys2, xs1)] + table[numpy.ix_(ys1, xs1)]
+    counts = numpy.outer(ys2 - ys1, xs2 - xs1)[:, :, None]
+    return sums, counts
+
+
+def _mean(total, count):
+    """Returns total / count rounded to the nearest int (halves round up)."""
+    return (2 * total + count) // (2 * count)
+
+
+def box_means(img, xs1, xs2, ys1, ys2, backend=None, out=None):
+    """
+    Returns a picture where each pixel is the average of a box of pixels of
+    img.
+
+    Pixel (i, j) of the result is the average of the pixels of img with
+    xs1[i] <= x < xs2[i] and ys1[j] <= y < ys2[j]. Every box must hold at
+    least one pixel.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    xs1, xs2 (type: list of int) - Left (inclusive) and right (exclusive)
+        edges of the boxes of each column of the result.
+    ys1, ys2 (type: list of int) - Top (inclusive) and bottom (exclusive)
+        edges of the boxes of each row of the result.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (a new picture is
+        made if None).
+
+    Returns:
+    (type: Picture) - The len(xs1) x len(ys1) picture of averages.
+    """
+    width, height = len(xs1), len(ys1)
+    if width == 0 or height == 0:
+        return filter_engine.make_result(img, b"", out, (width, height))
+
+    table = summed_area_table(img, backend)
+    if filter_engine.get_backend(backend) == "numpy":
+        sums, counts = _boxes_numpy(table, xs1, xs2, ys1, ys2)
+        return filter_engine.from_array(_mean(sums, counts), img.getTitle(),
+                out)
+
+    data = _boxes_python(table, xs1, xs2, ys1, ys2, _mean)
+    return filter_engine.make_result(img, data, out, (width, height))
+
+
+def box_filter(img, box_w, box_h, weight, backend=None):
+    """
+    Returns weight times the sum of every box_w x box_h box that fits inside
+    img, rounded (like round) and clipped to 0-255. This is the same as
+    convolving with a box_w x box_h kernel whose weights are all weight, but
+    costs the same for any box size.
+
+    Returns:
+    (type: bytes) - The RGB bytes of the (width - box_w + 1) x
+        (height - box_h + 1) result.
+    """
+    out_w = img.getWidth() - box_w + 1
+    out_h = img.getHeight() - box_h + 1
+    if out_w <= 0 or out_h <= 0:
+        return b""
+
+    xs1, ys1 = range(out_w), range(out_h)
+    xs2, ys2 = range(box_w, box_w + out_w), range(box_h, box_h + out_h)
+    table = summed_area_table(img, backend)
+
+    if filter_engine.get_backend(backend) == "numpy":
+        # the boxes are evenly spaced, so slices can replace the lookups
+        sums = table[box_h:, box_w:] - table[:out_h, box_w:] \
+                - table[box_h:, :out_w] + table[:out_h, :out_w]
+        out = numpy.clip(numpy.rint(sums * float(weight)), 0, 255)
+        return out.astype(numpy.uint8).tobytes()
+
+    return bytes(_boxes_python(table, xs1, xs2, ys1, ys2,
+            lambda total, count: min(255, max(0, round(total * weight)))))
+
+
+def box_blur(img, radius, backend=None, out=None):
+    """
+    Returns a copy of img where each pixel is the average of the
+    (2 * radius + 1) x (2 * radius + 1) box of pixels around it.
+
+    Near the edges only the part of the box inside the picture is averaged.
+    Any radius takes the same time.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    radius (type: int) - How far the box reaches from the pixel.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (a new picture is
+        made if None). It must not share pixels with img.
+
+    Returns:
+    (type: Picture) - The blurred picture.
+    """
+    if radius < 0:
+        raise ValueError("radius must not be negative")
+
+    width, height = img.getWidth(), img.getHeight()
+    xs1 = [max(0, x - radius) for x in range(width)]
+    xs2 = [min(width, x + radius + 1) for x in range(width)]
+    ys1 = [max(0, y - radius) for y in range(height)]
+    ys2 = [min(height, y + radius + 1) for y in range(height)]
+    return box_means(img, xs1, xs2, ys1, ys2, backend, out)
+
+
+def area_resize(img, width, height, backend=None, out=None):
+    """
+    Returns a copy of img shrunk to width x height, where each new pixel is
+    the average of the block of original pixels it covers.
+
+    Block edges are rounded to whole pixels, so blocks may differ in size by
+    one pixel when the sizes don't divide evenly. Any amount of shrinking
+    takes the same time per new pixel.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    width (type: int) - The new width (at most the original width).
+    height (type: int) - The new height (at most the original height).
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (a new picture is
+        made if None).
+
+    Returns:
+    (type: Picture) - The shrunk picture.
+    """
+    src_w, src_h = img.getWidth(), img.getHeight()
+    if not (0 <= width <= src_w and 0 <= height <= src_h):
+        raise ValueError("can't shrink a %dx%d picture to %dx%d"
+                % (src_w, src_h, width, height))
+
+    xs = [i * src_w // width for i in range(width + 1)] if width else [0]
+    ys = [j * src_h // height for j in range(height + 1)] if height else [0]
+    return box_means(img, xs[:-1], xs[1:], ys[:-1], ys[1:], backend, out)
+
+
+def reduce(img, factor, backend=None, out=None):
+    """
+    Shrinks img by an integer factor, averaging each factor x factor block
+    of pixels into one. Leftover rows and columns that don't fill a whole
+    block are dropped.
+
+    This is the same as resample.reduce, except that the averages are
+    rounded exactly (PIL's may be one off for factors that aren't powers of
+    2).
+    """
+    if factor < 1:
+        raise ValueError("factor must be at least 1")
+
+    width, height = img.getWidth() // factor, img.getHeight() // factor
+    xs = range(0, (width + 1) * factor, factor)
+    ys = range(0, (height + 1) * factor, factor)
+    return box_means(img, xs[:-1], xs[1:], ys[:-1], ys[1:], backend, out)
+
+
+# --- exact area resampling ----------------------------------------------------
+
+def area_edges(start, stop, count):
+    """
+    Returns the count + 1 (possibly fractional) edges that split start to
+    stop into count equal parts.
+    """
+    step = (stop - start) / count
+    return [start + i * step for i in range(count)] + [stop]
+
+
+def _area_positions(edges, n):
+    """
+    Returns the pixel index and the covered fraction of that pixel at each
+    edge, for a row (or column) of n pixels.
+    """
+    indices = [min(n - 1, int(x)) for x in edges]
+    return indices, [x - i for x, i in zip(edges, indices)]
+
+
+# The sum between two edges is worked out as the sum of the whole pixels
+# between their indices (a difference of prefix sums, which is exact) plus
+# and minus the covered fractions of the pixels at the edges. Only the
+# fractions are rounded, and they don't depend on where the prefix sums
+# start, so averaging a strip of rows gives exactly the same result as
+# averaging the whole picture (see tiled_collage.AreaShrinkSource).
+
+def _area_line(values, indices, fractions, lengths):
+    """
+    Returns the exact averages of values between the edges given by indices
+    and fractions (see _area_positions).
+    """
+    prefix = list(itertools.accumulate(values, initial=0))
+    return [((prefix[b] - prefix[a]) + fb * values[b] - fa * values[a]) / n
+            for a, b, fa, fb, n in zip(indices, indices[1:], fractions,
+                fractions[1:], lengths)]
+
+
+def _area_rows(rows, edges):
+    """
+    Returns the exact averages of a list of equally long rows between the
+    (possibly fractional) row edges, as one list of averages per pair of
+    edges.
+    """
+    indices, fractions = _area_positions(edges, len(rows))
+
+    # only the prefix sums at the edges are kept
+    wanted = set(indices)
+    prefix = {}
+    total = [0] * len(rows[0])
+    for i in range(max(indices) + 1):
+        if i in wanted:
+            prefix[i] = total
+        total = list(map(operator.add, total, rows[i]))
+
+    result = []
+    for j in range(len(edges) - 1):
+        a, b = indices[j], indices[j + 1]
+        fa, fb = fractions[j], fractions[j + 1]
+        n = edges[j + 1] - edges[j]
+        result.append([((pb - pa) + fb * vb - fa * va) / n
+                for pa, pb, va, vb in zip(prefix[a], prefix[b], rows[a],
+                    rows[b])])
+    return result
+
+
+def _area_numpy(arr, edges, axis):
+    """Returns the exact averages of arr between edges along axis."""
+    n = arr.shape[axis]
+    edges = numpy.asarray(edges, dtype=numpy.float64)
+    indices = numpy.minimum(n - 1, edges.astype(numpy.int64))
+    fractions = edges - indices
+    a, b = indices[:-1], indices[1:]
+
+    shape = [1, 1, 1]
+    shape[axis] = len(edges) - 1
+    fa, fb = fractions[:-1].reshape(shape), fractions[1:].reshape(shape)
+    lengths = numpy.diff(edges).reshape(shape)
+
+    prefix = numpy.cumsum(arr, axis=axis, dtype=numpy.float64)
+    prefix = numpy.concatenate((numpy.zeros_like(prefix.take([0], axis)),
+            prefix), axis)
+    sums = (prefix.take(b, axis) - prefix.take(a, axis)) \
+            + fb * arr.take(b, axis) - fa * arr.take(a, axis)
+    return sums / lengths
+
+
+def area_resample_edges(img, xs, ys, backend=None, out=None):
+    """
+    Returns the picture whose pixel (i, j) is the exact average of the part
+    of img between xs[i] and xs[i + 1] across and ys[j] and ys[j + 1] down
+    (see area_resample). The edges may be fractional, but must be
+    increasing and inside img.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    xs (type: list of float) - The column edges, one more than the width of
+        the result.
+    ys (type: list of float) - The row edges, one more than the height of
+        the result.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (a new picture is
+        made if None).
+
+    Returns:
+    (type: Picture) - The resampled picture.
+    """
+    src_w = img.getWidth()
+    width, height = len(xs) - 1, len(ys) - 1
+    if width <= 0 or height <= 0:
+        return filter_engine.make_result(img, b"", out,
+                (max(0, width), max(0, height)))
+
+    if filter_engine.get_backend(backend) == "numpy":
+        arr = _area_numpy(_area_numpy(filter_engine.to_array(img), ys, 0), xs, 1)
+        arr = numpy.clip(numpy.floor(arr + 0.5), 0, 255).astype(numpy.uint8)
+        return filter_engine.from_array(arr, img.getTitle(), out)
+
+    x_indices, x_fractions = _area_positions(xs, src_w)
+    x_lengths = [b - a for a, b in zip(xs, xs[1:])]
+
+    result = bytearray(width * height * 3)
+    for c in range(3):
+        channel = img.getChannel(c)
+        rows = [channel[y * src_w:(y + 1) * src_w]
+                for y in range(img.getHeight())]
+        # average down the columns a row at a time, then along each row
+        for y, row in enumerate(_area_rows(rows, ys)):
+            values = _area_line(row, x_indices, x_fractions, x_lengths)
+            start = y * width * 3 + c
+            result[start:start + width * 3:3] = bytes(
+                    min(255, max(0, math.floor(v + 0.5))) for v in values)
+
+    return filter_engine.make_result(img, result, out, (width, height))
+
+
+def area_resample(img, width, height, box=None, backend=None, out=None):
+    """
+    Returns img resized to width x height, where each new pixel is the exact
+    average of the part of img it covers. Pixels only partly covered count
+    for just the covered part, so the result doesn't depend on how the
+    sizes divide.
+
+    This costs the same for any amount of shrinking. It is used to finish
+    shrinking from a pyramid level or a reduced-scale JPEG decode (see
+    resample.resize and resample.load_fit), where PIL's box filter is too
+    coarse.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    width (type: int) - The new width.
+    height (type: int) - The new height.
+    box (type: tuple) - The (left, top, right, bottom) part of img to
+        resample, in (possibly fractional) pixels. The whole picture if None.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result (a new picture is
+        made if None).
+
+    Returns:
+    (type: Picture) - The resized picture.
+    """
+    src_w, src_h = img.getWidth(), img.getHeight()
+    left, top, right, bottom = (0, 0, src_w, src_h) if box is None else box
+    if not (0 <= left < right <= src_w and 0 <= top < bottom <= src_h):
+        raise ValueError("box %r is not inside the %dx%d picture"
+                % (box, src_w, src_h))
+    if width == 0 or height == 0:
+        return filter_engine.make_result(img, b"", out, (width, height))
+
+    return area_resample_edges(img, area_edges(left, right, width),
+            area_edges(top, bottom, height), backend, out)
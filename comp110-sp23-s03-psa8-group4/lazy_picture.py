@@ -0,0 +1,257 @@
+"""
+Module: lazy_picture
+
+Builds chains of filters that are only run when the result is needed.
+
+A LazyPicture records the operations applied to a Picture instead of running
+them straight away. When the result is needed (compute, save or show) the
+recorded chain is simplified first:
+
+- Point operations (brighten, negative, point, ...) change each channel value
+  on its own, so a run of them is fused into a single 256 entry lookup table
+  per channel (see the lut module) and applied in one pass.
+- gray is applied in the same pass as the lookup tables around it.
+- Flips don't change any colors, so they are combined (two of the same flip
+  cancel out) and done once, at the end.
+
+So a chain of N point operations costs one pass over the pixels instead of
+N passes and N copies.
+
+Example:
+    pic = comp110_image.Picture(filename="tiger.jpg")
+    LazyPicture(pic).brighten(1.5).gray().negative().flip_vertical().save("x.png")
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import filter_engine
+import lut
+import resample
+from filter_engine import numpy
+
+
+class LazyPicture:
+    """
+    A picture described by a source Picture plus a chain of operations that
+    haven't been run yet.
+
+    Every operation returns a new LazyPicture, so a chain can be shared and
+    extended in different ways.
+    """
+
+    def __init__(self, source, operations=()):
+        self.__source = source
+        self.__operations = tuple(operations)
+        self.__result = None
+
+    def __then(self, *operation):
+        """Returns a new LazyPicture with operation added to the chain."""
+        return LazyPicture(self.__source, self.__operations + (operation,))
+
+    def get_operations(self):
+        """Returns the chain of operations, as a tuple of tuples."""
+        return self.__operations
+
+    def get_width(self):
+        width = self.__source.getWidth()
+        for operation in self.__operations:
+            if operation[0] == "resize":
+                width = operation[1]
+        return width
+
+    def get_height(self):
+        height = self.__source.getHeight()
+        for operation in self.__operations:
+            if operation[0] == "resize":
+                height = operation[2]
+        return height
+
+    def point(self, red_table, green_table=None, blue_table=None):
+        """
+        Changes every channel value v to table[v]. A different table may be
+        given for each channel; if only one is given it is used for all three.
+        """
+        return self.__then("point",
+                lut.channel_tables(red_table, green_table, blue_table))
+
+    def brighten(self, factor):
+        """Multiplies every channel by factor (like unique_filter)."""
+        return self.point(lut.brightness(factor))
+
+    def contrast(self, factor, middle=128):
+        """Scales every channel away from or towards middle (see lut.contrast)."""
+        return self.point(lut.contrast(factor, middle))
+
+    def gamma(self, value):
+        """Applies gamma correction (see lut.gamma)."""
+        return self.point(lut.gamma(value))
+
+    def negative(self):
+        """Replaces every channel value v by 255 - v."""
+        return self.point(lut.invert())
+
+    def threshold(self, level):
+        """Makes channel values below level 0 and the rest 255."""
+        return self.point(lut.threshold(level))
+
+    def posterize(self, bits):
+        """Keeps only the top bits of every channel (see lut.posterize)."""
+        return self.point(lut.posterize(bits))
+
+    def gray(self):
+        """Sets every channel to the average of the three (like gray_filter)."""
+        return self.__then("gray")
+
+    def flip_vertical(self):
+        """Flips the picture upside down."""
+        return self.__then("flip", True, False)
+
+    def flip_horizontal(self):
+        """Flips the picture left to right."""
+        return self.__then("flip", False, True)
+
+    def resize(self, width, height, method="area"):
+        """Resizes the picture (see resample.resize)."""
+        return self.__then("resize", width, height, method)
+
+    def compute(self, backend=None):
+        """
+        Runs the chain of operations and returns the resulting Picture.
+
+        The result is remembered, so computing it again is free.
+        """
+        if self.__result is None:
+            pic = self.__source
+            for segment, resize in _split_at_resizes(self.__operations):
+                pic = _run_segment(pic, segment, backend)
+                if resize is not None:
+                    pic = resample.resize(pic, *resize[1:])
+            self.__result = pic if pic is not self.__source else pic.copy()
+
+        return self.__result
+
+    def save(self, filename, backend=None):
+        """Computes the picture and saves it to a file."""
+        self.compute(backend).save(filename)
+
+    def show(self, max_size=None, backend=None):
+        """Computes the picture and displays it in a new window."""
+        self.compute(backend).show(max_size)
+
+    # camelCase alternative names
+    getWidth = get_width
+    getHeight = get_height
+    getOperations = get_operations
+    flipVertical = flip_vertical
+    flipHorizontal = flip_horizontal
+
+
+def _split_at_resizes(operations):
+    """
+    Splits a chain of operations into (segment, resize) pairs, where segment
+    holds the operations before the resize (which may be None at the end).
+    """
+    segment = []
+    for operation in operations:
+        if operation[0] == "resize":
+            yield segment, operation
+            segment = []
+        else:
+            segment.append(operation)
+    yield segment, None
+
+
+def fuse(operations):
+    """
+    Simplifies a chain of point, gray and flip operations.
+
+    Parameters:
+    operations (type: list of tuple) - The chain, without any resizes.
+
+    Returns:
+    (type: tuple) - (steps, flip_vertical, flip_horizontal) where steps is a
+        list of ("point", tables) and ("gray",) steps, with no two point
+        steps next to each other.
+    """
+    steps = []
+    flip_v = flip_h = False
+
+    for operation in operations:
+        kind = operation[0]
+        if kind == "flip":
+            # flips commute with color changes, so just count them
+            flip_v ^= operation[1]
+            flip_h ^= operation[2]
+        elif kind == "point":
+            if steps and steps[-1][0] == "point":
+                previous = steps.pop()[1]
+                tables = tuple(lut.compose(a, b)
+                        for a, b in zip(previous, operation[1]))
+            else:
+                tables = operation[1]
+            if tables != (lut.IDENTITY,) * 3:
+                steps.append(("point", tables))
+        elif kind == "gray":
+            # gray of a picture that is already gray changes nothing
+            if not (steps and steps[-1][0] == "gray"):
+                steps.append(("gray",))
+        else:
+            raise ValueError("unknown operation %r" % (kind,))
+
+    return steps, flip_v, flip_h
+
+
+def _run_steps_python(data, steps):
+    """Applies fused point/gray steps to RGB bytes using only Python."""
+    if len(steps) == 1 and steps[0][0] == "point":
+        return lut.translate(data, steps[0][1])
+
+    channels = [data[0::3], data[1::3], data[2::3]]
+    for step in steps:
+        if step[0] == "point":
+            channels = [c.translate(t) for c, t in zip(channels, step[1])]
+        else:
+            gray = bytes(map(lambda r, g, b: (r + g + b) // 3, *channels))
+            channels = [gray, gray, gray]
+
+    result = bytearray(len(data))
+    result[0::3] = channels[0]
+    result[1::3] = channels[1]
+    result[2::3] = channels[2]
+    return result
+
+
+def _run_steps_numpy(arr, steps):
+    """Applies fused point/gray steps to a (height, width, 3) array."""
+    for step in steps:
+        if step[0] == "point":
+            tables = numpy.frombuffer(b"".join(step[1]), numpy.uint8).reshape(3, 256)
+            arr = tables[numpy.arange(3), arr]
+        else:
+            gray = (arr.sum(axis=2, dtype=numpy.uint16) // 3).astype(numpy.uint8)
+            arr = numpy.repeat(gray[:, :, None], 3, axis=2)
+    return arr
+
+
+def _run_segment(pic, operations, backend):
+    """Runs a chain of operations (without resizes) on pic."""
+    steps, flip_v, flip_h = fuse(operations)
+    if not steps and not flip_v and not flip_h:
+        return pic
+
+    backend = filter_engine.get_backend(backend)
+    if steps:
+        if backend == "numpy":
+            arr = _run_steps_numpy(filter_engine.to_array(pic), steps)
+            pic = filter_engine.from_array(arr, pic.getTitle())
+        else:
+            pic = filter_engine.make_result(pic,
+                    _run_steps_python(pic.getBytes(), steps))
+
+    if flip_v:
+        pic = filter_engine.flip_vertical(pic, backend)
+    if flip_h:
+        pic = filter_engine.flip_horizontal(pic, backend)
+    return pic
@@ -0,0 +1,142 @@
+"""
+Module: lut
+
+Lookup tables (LUTs) for point operations.
+
+A point operation changes each channel value on its own, without looking at
+any other pixel or channel (e.g. brightening, inverting, thresholding).
+Since a channel value is one of only 256 numbers, the whole operation can be
+worked out once, as a 256 byte table where table[v] is the new value of v,
+and then applied to every channel of every pixel with a single
+bytes.translate (see Picture.apply_lut and filter_engine.point). This needs
+no NumPy, and is as fast as copying the pixels.
+
+Several point operations in a row can be composed into one table, so they
+still cost a single pass over the pixels:
+
+    table = lut.compose(lut.brightness(1.5), lut.gamma(2.2), lut.invert())
+    pic.apply_lut(table)
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+# Table that leaves channel values unchanged
+IDENTITY = bytes(range(256))
+
+
+def _clip(value):
+    """Returns value as an int clipped to 0-255."""
+    return min(255, max(0, int(value)))
+
+
+def check_table(table):
+    """
+    Returns table as bytes, raising a ValueError if it doesn't have exactly
+    256 entries.
+    """
+    table = bytes(table)
+    if len(table) != 256:
+        raise ValueError("lookup tables must have exactly 256 entries, not %d"
+                % len(table))
+    return table
+
+
+def from_function(function):
+    """
+    Returns the table for function, which is given a channel value (0-255)
+    and returns its new value. Results are truncated to an int and clipped to
+    0-255.
+    """
+    return bytes(_clip(function(v)) for v in range(256))
+
+
+def brightness(factor):
+    """
+    Returns the table that multiplies channel values by factor (like
+    unique_filter), truncating the result.
+    """
+    return from_function(lambda v: v * factor)
+
+
+def contrast(factor, middle=128):
+    """
+    Returns the table that scales channel values away from (factor > 1) or
+    towards (factor < 1) middle, rounding the result.
+    """
+    return from_function(lambda v: round((v - middle) * factor + middle))
+
+
+def gamma(value):
+    """
+    Returns the gamma correction table v -> 255 * (v / 255) ** (1 / value).
+    Values above 1 brighten the dark and middle tones, values below 1 darken
+    them.
+    """
+    if value <= 0:
+        raise ValueError("gamma must be positive")
+    return from_function(lambda v: round(255 * (v / 255) ** (1 / value)))
+
+
+def invert():
+    """Returns the table that changes v to 255 - v (like examples.negative)."""
+    return bytes(255 - v for v in range(256))
+
+
+def threshold(level):
+    """Returns the table that makes values below level 0 and the rest 255."""
+    return bytes(255 if v >= level else 0 for v in range(256))
+
+
+def posterize(bits):
+    """
+    Returns the table that keeps only the top bits (1 to 8) of each channel
+    value, leaving 2 ** bits different levels.
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError("bits must be between 1 and 8")
+    mask = (0xFF << (8 - bits)) & 0xFF
+    return bytes(v & mask for v in range(256))
+
+
+def compose(*tables):
+    """
+    Returns the table that has the same effect as applying each of tables in
+    turn (the first one first).
+    """
+    result = IDENTITY
+    for table in tables:
+        result = result.translate(check_table(table))
+    return result
+
+
+def channel_tables(red, green=None, blue=None):
+    """
+    Returns a (red, green, blue) tuple of tables. If green or blue is None,
+    the red table is used for that channel too.
+    """
+    red = check_table(red)
+    green = red if green is None else check_table(green)
+    blue = red if blue is None else check_table(blue)
+    return (red, green, blue)
+
+
+def translate(data, tables):
+    """
+    Returns the RGB bytes in data with a (red, green, blue) tuple of tables
+    applied.
+    """
+    if not isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+
+    red, green, blue = tables
+    if red == green == blue:
+        # one table for every channel: a single pass over all the bytes
+        return data.translate(red)
+
+    result = bytearray(len(data))
+    result[0::3] = data[0::3].translate(red)
+    result[1::3] = data[1::3].translate(green)
+    result[2::3] = data[2::3].translate(blue)
+    return result
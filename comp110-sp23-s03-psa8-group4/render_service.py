@@ -0,0 +1,747 @@
+"""
+Module: render_service
+
+A long-running local service that makes collages on request, for use from
+a web backend (or anything else that can send an HTTP request).
+
+Example:
+    python render_service.py --port 8110 -j 4
+    curl -X POST localhost:8110/render \\
+        -d '{"source": "/photos/cat.jpg", "width": 900, "height": 600}'
+
+or, over a Unix socket:
+    python render_service.py --unix /tmp/collage.sock
+    curl --unix-socket /tmp/collage.sock -X POST localhost/render -d '...'
+
+Requests:
+
+POST /render  - Makes a collage. The JSON body holds:
+                source  - path of the picture (required)
+                width   - maximum width of the collage (required)
+                height  - maximum height of the collage (required)
+                filters - names (see collage_creator.FILTER_NAMES) or
+                          numbers of the filters to use, in the order of
+                          their tiles (default: all six, in the usual
+                          collage layout)
+                output  - file name to save the collage as, inside the
+                          --output-dir (default: a name made from the job)
+                format  - file format when output isn't given (default: png)
+                timeout - seconds to wait for the collage, at most
+                          --timeout
+                The response holds the output path, the collage size and
+                how long the job waited and ran.
+GET /metrics  - Queue depth, job counts and latency statistics.
+GET /health   - {"status": "ok"} while the service is running.
+
+Jobs are run by a pool of worker processes that is started (and warmed up
+by making a tiny collage) once, so a request never waits for Python, PIL
+or NumPy to start. Workers keep the last few pictures they decoded, and
+shrink them from their pyramids (see Picture.get_pyramid_level), so
+collages of several sizes of the same picture are cheap.
+
+At most --queue-size jobs wait for a worker. When the queue is full, new
+jobs are turned away at once with "503 Service Unavailable" (and a
+Retry-After header) rather than piling up. A job that hasn't finished
+within its timeout gets "504 Gateway Timeout"; if it had already started,
+its worker can't be interrupted, so it still finishes (and saves) the
+collage before taking the next job.
+
+A job identical to one still waiting or running (same picture, unchanged
+on disk, and same size, filters and output) isn't run twice: both
+requests get the result of the first, though each still gives up at its
+own timeout.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+import collage_creator
+import comp110_image
+import resample
+
+# Default TCP port of the service
+DEFAULT_PORT = 8110
+
+# Default number of jobs that may wait for a worker
+DEFAULT_QUEUE_SIZE = 64
+
+# Default (and longest) number of seconds a request waits for its collage
+DEFAULT_TIMEOUT = 60.0
+
+# How many decoded pictures each worker keeps
+DEFAULT_SOURCE_CACHE = 4
+
+# How many of the latest jobs the latency statistics are worked out from
+LATENCY_WINDOW = 1000
+
+# Largest request body accepted, in bytes
+MAX_BODY = 1024 * 1024
+
+# Filters of a normal collage, in the order of their tiles
+ALL_FILTERS = tuple(range(collage_creator.NUM_FILTERS))
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+        405: "Method Not Allowed", 413: "Payload Too Large",
+        500: "Internal Server Error", 503: "Service Unavailable",
+        504: "Gateway Timeout"}
+
+
+class QueueFullError(Exception):
+    """Raised when a job is turned away because the queue is full."""
+
+
+# --- worker processes ---------------------------------------------------------
+
+# Pictures decoded by this worker, most recently used last
+_sources = collections.OrderedDict()
+_source_cache_size = DEFAULT_SOURCE_CACHE
+
+
+def _warm_up(backend, source_cache_size):
+    """
+    Runs once in each worker process when it starts, so that everything is
+    imported and ready before the first real job.
+    """
+    global _source_cache_size
+    _source_cache_size = source_cache_size
+    # a worker doesn't need to react to ctrl-c, the service shuts it down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pic = comp110_image.Picture(12, 8)
+    collage_creator.create_collage(pic, 12, 8, backend)
+
+
+def _load_source(source):
+    """
+    Returns the picture in the file source, reusing it if this worker
+    decoded the same (unchanged) file recently.
+    """
+    stat = os.stat(source)
+    key = (source, stat.st_mtime_ns, stat.st_size)
+    pic = _sources.pop(key, None)
+    if pic is None:
+        if comp110_image.is_raw_file(source):
+            pic = comp110_image.open_raw(source)
+        else:
+            pic = comp110_image.Picture(filename=source)
+    _sources[key] = pic
+    while len(_sources) > _source_cache_size:
+        _sources.popitem(last=False)
+    return pic
+
+
+def make_collage(pic, max_w, max_h, filters=ALL_FILTERS, backend=None):
+    """
+    Returns a collage of pic made with the given filters.
+
+    With all six filters in their usual order this is the collage of
+    collage_creator.create_collage. Otherwise the tiles are laid out left to
+    right, three to a row, in the order of filters.
+
+    Parameters:
+    pic (type: Picture) - The picture to make a collage of.
+    max_w (type: int) - The maximum width of the collage.
+    max_h (type: int) - The maximum height of the collage.
+    filters (type: tuple of int) - Which filters to use (see
+        collage_creator.apply_collage_filter).
+    backend (type: str) - "python" or "numpy" (see filter_engine).
+
+    Returns:
+    (type: Picture) - The collage.
+    """
+    if tuple(filters) == ALL_FILTERS:
+        return collage_creator.create_collage(pic, max_w, max_h, backend,
+                pyramid=True)
+
+    cols = min(3, len(filters))
+    rows = math.ceil(len(filters) / cols)
+    shrink_pic = resample.fit(pic, max_w // cols, max_h // rows, "area",
+            pyramid=True)
+    w, h = shrink_pic.getWidth(), shrink_pic.getHeight()
+
+    collage = comp110_image.Picture(w * cols, h * rows)
+    for i, index in enumerate(filters):
+        tile = collage.getView(i % cols * w, i // cols * h, w, h)
+        collage_creator.apply_collage_filter(index, shrink_pic, backend, tile)
+    return collage
+
+
+def render(source, output, max_w, max_h, filters=ALL_FILTERS, backend=None):
+    """
+    Makes the collage of one job and saves it (run in a worker process).
+
+    The collage is written to a temporary file first and then renamed, so
+    output never holds half a collage.
+
+    Returns:
+    (type: dict) - The width and height of the collage and the seconds
+        spent loading, making and saving it.
+    """
+    start = time.perf_counter()
+    pic = _load_source(source)
+    loaded = time.perf_counter()
+    collage = make_collage(pic, max_w, max_h, filters, backend)
+    created = time.perf_counter()
+
+    directory, name = os.path.split(os.path.abspath(output))
+    fd, temp = tempfile.mkstemp(prefix=".render-", suffix=name, dir=directory)
+    os.close(fd)
+    try:
+        collage.save(temp)
+        os.replace(temp, output)
+    except BaseException:
+        os.remove(temp)
+        raise
+    saved = time.perf_counter()
+
+    return {"width": collage.getWidth(), "height": collage.getHeight(),
+            "load": loaded - start, "collage": created - loaded,
+            "save": saved - created}
+
+
+# --- jobs ---------------------------------------------------------------------
+
+def _parse_filters(filters):
+    """Returns the filter numbers for a list of filter names or numbers."""
+    if filters is None:
+        return ALL_FILTERS
+    if not isinstance(filters, list) or not filters:
+        raise ValueError("filters must be a non-empty list")
+
+    result = []
+    for f in filters:
+        if isinstance(f, str) and f in collage_creator.FILTER_NAMES:
+            result.append(collage_creator.FILTER_NAMES.index(f))
+        elif isinstance(f, int) and not isinstance(f, bool) \
+                and 0 <= f < collage_creator.NUM_FILTERS:
+            result.append(f)
+        else:
+            raise ValueError("unknown filter %r (use one of %s or 0 to %d)"
+                    % (f, ", ".join(collage_creator.FILTER_NAMES),
+                    collage_creator.NUM_FILTERS - 1))
+    return tuple(result)
+
+
+class RenderJob:
+    """
+    One collage to make, shared by every request asking for it.
+    """
+
+    def __init__(self, key, args, deadline):
+        """
+        Parameters:
+        key (type: str) - Identifies the job (see RenderService.make_job).
+        args (type: tuple) - The arguments for render.
+        deadline (type: float) - time.monotonic() by which the job must be
+            done.
+        """
+        self.key = key
+        self.args = args
+        self.deadline = deadline
+        self.queued = time.monotonic()
+        self.started = None
+        self.future = asyncio.get_running_loop().create_future()
+        # every request may have given up waiting by the time the job
+        # fails, so mark the error as seen to keep asyncio from warning
+        self.future.add_done_callback(
+                lambda future: future.cancelled() or future.exception())
+
+
+def _latency_stats(values):
+    """Returns the count, mean, median, 95th percentile and max of values."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {"count": len(ordered), "mean": statistics.fmean(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1]}
+
+
+class RenderService:
+    """
+    Queues render jobs and runs them on a pool of worker processes.
+
+    Use it with "async with", or call start and stop.
+    """
+
+    def __init__(self, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+            timeout=DEFAULT_TIMEOUT, output_dir=None, backend=None,
+            source_cache=DEFAULT_SOURCE_CACHE):
+        """
+        Parameters:
+        workers (type: int) - Number of worker processes (default: the
+            number of CPUs).
+        queue_size (type: int) - How many jobs may wait for a worker.
+        timeout (type: float) - Default and longest seconds a job may take,
+            counting the time spent waiting in the queue.
+        output_dir (type: str) - Where to save collages when a job doesn't
+            say (default: a new temporary directory).
+        backend (type: str) - "python" or "numpy" (see filter_engine).
+        source_cache (type: int) - How many decoded pictures each worker
+            keeps.
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.__workers = workers or os.cpu_count() or 1
+        self.__queue_size = queue_size
+        self.__timeout = timeout
+        self.__output_dir = output_dir
+        self.__backend = backend
+        self.__source_cache = source_cache
+
+        self.__queue = None
+        self.__executor = None
+        self.__dispatchers = []
+        self.__in_flight = {}
+        self.__running = 0
+        self.__started = None
+
+        self.__counts = dict.fromkeys(("submitted", "deduplicated", "rejected",
+                "completed", "failed", "timed_out", "abandoned"), 0)
+        self.__latencies = {name: collections.deque(maxlen=LATENCY_WINDOW)
+                for name in ("queue_wait", "run", "total")}
+
+    async def start(self):
+        """Starts the worker processes and the tasks that feed them."""
+        if self.__output_dir is None:
+            self.__output_dir = tempfile.mkdtemp(prefix="collages-")
+        os.makedirs(self.__output_dir, exist_ok=True)
+
+        self.__queue = asyncio.Queue(self.__queue_size)
+        self.__executor = self.__make_executor()
+        # start every worker now, rather than on its first job
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.__executor, os.getpid)
+                for _ in range(self.__workers)))
+
+        self.__dispatchers = [asyncio.create_task(self.__dispatch())
+                for _ in range(self.__workers)]
+        self.__started = time.monotonic()
+
+    async def stop(self):
+        """Stops taking jobs and shuts the worker processes down."""
+        for task in self.__dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.__dispatchers, return_exceptions=True)
+        self.__dispatchers = []
+
+        for job in self.__in_flight.values():
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("the service stopped"))
+        self.__in_flight.clear()
+
+        if self.__executor is not None:
+            executor, self.__executor = self.__executor, None
+            # wait for the workers to exit without blocking the event loop
+            await asyncio.get_running_loop().run_in_executor(None,
+                    functools.partial(executor.shutdown, cancel_futures=True))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def __make_executor(self):
+        # forked workers would keep copies of whatever connections are open
+        # when they start (so closing one wouldn't end it), which happens
+        # when a broken pool is replaced while requests are waiting, so they
+        # are started from a clean fork server where there is one
+        method = "forkserver" \
+                if "forkserver" in multiprocessing.get_all_start_methods() \
+                else None
+        return concurrent.futures.ProcessPoolExecutor(self.__workers,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_warm_up,
+                initargs=(self.__backend, self.__source_cache))
+
+    def get_output_dir(self):
+        return self.__output_dir
+
+    def make_job(self, request):
+        """
+        Checks a render request (the JSON body of POST /render, as a dict)
+        and returns its RenderJob, or the job already waiting or running for
+        an identical request.
+
+        Raises a ValueError if the request isn't valid and a
+        FileNotFoundError if its picture doesn't exist.
+
+        A job is only ever written inside the output directory: output must
+        be a relative path without "..".
+        """
+        if not isinstance(request, dict):
+            raise ValueError("the request must be a JSON object")
+        source = request.get("source")
+        max_w, max_h = request.get("width"), request.get("height")
+        if not isinstance(source, str):
+            raise ValueError("source must be the path of a picture")
+        if not all(isinstance(v, int) and not isinstance(v, bool)
+                for v in (max_w, max_h)):
+            raise ValueError("width and height must be integers")
+
+        filters = _parse_filters(request.get("filters"))
+        cols = min(3, len(filters))
+        rows = math.ceil(len(filters) / cols)
+        if max_w < cols or max_h < rows:
+            raise ValueError("the collage must be at least %dx%d" % (cols, rows))
+
+        timeout = self.__request_timeout(request)
+
+        source = os.path.realpath(source)
+        stat = os.stat(source)
+        output = request.get("output")
+        if output is not None:
+            output = self.__output_path(output)
+        fmt = request.get("format", "png")
+        if not isinstance(fmt, str) or not fmt.isalnum():
+            raise ValueError("format must be a file extension, e.g. png")
+
+        # the same picture (unchanged on disk) made the same way is the
+        # same job
+        key = hashlib.sha256(json.dumps([source, stat.st_mtime_ns,
+                stat.st_size, max_w, max_h, filters, output,
+                None if output else fmt]).encode()).hexdigest()
+        job = self.__in_flight.get(key)
+        if job is not None and not job.future.done() \
+                and job.deadline > time.monotonic():
+            return job
+
+        if output is None:
+            output = os.path.join(self.__output_dir, "%s.%s" % (key[:32], fmt))
+        args = (source, output, max_w, max_h, filters, self.__backend)
+        return RenderJob(key, args, time.monotonic() + timeout)
+
+    def __request_timeout(self, request):
+        """
+        Returns the seconds a request may wait: its own timeout, but at most
+        the service's.
+        """
+        timeout = request.get("timeout", self.__timeout)
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) \
+                or timeout <= 0:
+            raise ValueError("timeout must be a positive number")
+        return min(timeout, self.__timeout)
+
+    def __output_path(self, output):
+        """
+        Returns where to save a collage whose request asked for output,
+        which must be a relative path inside the output directory.
+        """
+        if not isinstance(output, str) or not output:
+            raise ValueError("output must be a file name")
+        parts = output.replace("\\", "/").split("/")
+        if os.path.isabs(output) or ".." in parts:
+            raise ValueError("output must be a relative path without '..'")
+
+        output_dir = os.path.realpath(self.__output_dir)
+        path = os.path.realpath(os.path.join(output_dir, output))
+        # a symbolic link inside the output directory could still lead out
+        if os.path.commonpath((output_dir, path)) != output_dir \
+                or path == output_dir:
+            raise ValueError("output must be inside the output directory")
+        return path
+
+    async def submit(self, request):
+        """
+        Makes the collage for a render request and returns the result.
+
+        Raises QueueFullError if too many jobs are waiting,
+        asyncio.TimeoutError if the collage isn't made in time and whatever
+        render raised if making it failed (see also make_job).
+
+        Returns:
+        (type: dict) - The output path, the width and height of the collage,
+            the seconds spent waiting in the queue, running and in total,
+            and whether the job was shared with an earlier request.
+        """
+        job = self.make_job(request)
+        deadline = time.monotonic() + self.__request_timeout(request)
+        deduplicated = self.__in_flight.get(job.key) is job
+        if deduplicated:
+            self.__counts["deduplicated"] += 1
+        else:
+            try:
+                self.__queue.put_nowait(job)
+            except asyncio.QueueFull:
+                self.__counts["rejected"] += 1
+                raise QueueFullError("%d jobs are already waiting"
+                        % self.__queue_size) from None
+            self.__in_flight[job.key] = job
+            self.__counts["submitted"] += 1
+
+        # don't wait past the deadline even while the job is still queued;
+        # the dispatcher drops it (and counts it) when it gets to it. A
+        # request sharing an earlier job gives up at its own deadline if
+        # that comes first.
+        wait_until = min(deadline, job.deadline)
+        result = await asyncio.wait_for(asyncio.shield(job.future),
+                max(0, wait_until - time.monotonic()))
+        return dict(result, deduplicated=deduplicated)
+
+    async def __dispatch(self):
+        """Feeds jobs from the queue to a worker, one at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.__queue.get()
+            try:
+                await self.__run(loop, job)
+            finally:
+                self.__forget(job)
+                self.__queue.task_done()
+
+    def __forget(self, job):
+        """
+        Stops sharing job with new requests, unless a newer job with the
+        same key has already taken its place.
+        """
+        if self.__in_flight.get(job.key) is job:
+            del self.__in_flight[job.key]
+
+    async def __run(self, loop, job):
+        """Runs one job on a worker, enforcing its deadline."""
+        remaining = job.deadline - time.monotonic()
+        if remaining <= 0:
+            self.__fail(job, asyncio.TimeoutError())
+            return
+
+        job.started = time.monotonic()
+        self.__running += 1
+        executor = self.__executor
+        try:
+            future = loop.run_in_executor(executor, render, *job.args)
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future),
+                        remaining)
+            except asyncio.TimeoutError:
+                self.__fail(job, asyncio.TimeoutError())
+                # the worker can't be interrupted, so wait for it to be
+                # free again before giving it another job
+                self.__counts["abandoned"] += 1
+                await asyncio.gather(future, return_exceptions=True)
+                return
+        except concurrent.futures.BrokenExecutor as e:
+            # a worker died (e.g. ran out of memory), so start new ones. Every
+            # job on the broken pool fails at once, so only the first
+            # dispatcher to get here (while the pool is still the one it
+            # used) replaces it.
+            self.__fail(job, e)
+            if self.__executor is executor:
+                executor.shutdown(wait=False)
+                self.__executor = self.__make_executor()
+            return
+        except Exception as e:
+            self.__fail(job, e)
+            return
+        finally:
+            self.__running -= 1
+
+        now = time.monotonic()
+        timings = {"queue_wait": job.started - job.queued,
+                "run": now - job.started, "total": now - job.queued}
+        for name, value in timings.items():
+            self.__latencies[name].append(value)
+        self.__counts["completed"] += 1
+        if not job.future.done():
+            job.future.set_result(dict(result, output=job.args[1], **timings))
+
+    def __fail(self, job, error):
+        # a new identical request must get a new job, not this failed one
+        # (whose worker may still be busy with it)
+        self.__forget(job)
+        key = "timed_out" if isinstance(error, asyncio.TimeoutError) else "failed"
+        self.__counts[key] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def get_metrics(self):
+        """
+        Returns the current state of the service: queue depth, running and
+        in-flight jobs, job counts since it started and latency statistics
+        (in seconds) of the latest jobs.
+        """
+        return {
+            "uptime": time.monotonic() - self.__started
+                    if self.__started is not None else 0,
+            "workers": self.__workers,
+            "queue_depth": self.__queue.qsize() if self.__queue else 0,
+            "queue_size": self.__queue_size,
+            "running": self.__running,
+            "in_flight": len(self.__in_flight),
+            "jobs": dict(self.__counts),
+            "latency": {name: _latency_stats(values)
+                    for name, values in self.__latencies.items()},
+        }
+
+    # --- HTTP -----------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        """Answers one HTTP request (see the module docstring)."""
+        try:
+            status, body, headers = await self.__handle_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            writer.close()
+            return
+
+        data = json.dumps(body).encode() + b"\n"
+        head = ["HTTP/1.1 %d %s" % (status, _REASONS[status]),
+                "Content-Type: application/json",
+                "Content-Length: %d" % len(data), "Connection: close"]
+        head += ["%s: %s" % item for item in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def __handle_request(self, reader):
+        """Returns the (status, JSON body, extra headers) of the response."""
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, _ = lines[0].split(" ", 2)
+            headers = dict(line.split(":", 1) for line in lines[1:] if line)
+            headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            return 400, {"error": "malformed request"}, {}
+        if length < 0:
+            return 400, {"error": "malformed request"}, {}
+        if length > MAX_BODY:
+            return 413, {"error": "request too large"}, {}
+        body = await reader.readexactly(length)
+
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, {"status": "ok"}, {}
+        if path == "/metrics":
+            return 200, self.get_metrics(), {}
+        if path != "/render":
+            return 404, {"error": "unknown path %s" % path}, {}
+        if method != "POST":
+            return 405, {"error": "use POST to render"}, {"Allow": "POST"}
+
+        try:
+            return 200, await self.submit(json.loads(body or b"null")), {}
+        except (ValueError, UnicodeDecodeError) as e:
+            return 400, {"error": str(e)}, {}
+        except FileNotFoundError as e:
+            return 404, {"error": "no such picture: %s" % e.filename}, {}
+        except QueueFullError as e:
+            return 503, {"error": str(e)}, {"Retry-After": "1"}
+        except asyncio.TimeoutError:
+            return 504, {"error": "the collage wasn't made in time"}, {}
+        except Exception as e:
+            return 500, {"error": "%s: %s" % (type(e).__name__, e)}, {}
+
+    # camelCase alternative names
+    getOutputDir = get_output_dir
+    makeJob = make_job
+    getMetrics = get_metrics
+    handleConnection = handle_connection
+
+
+async def serve(service, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+    """
+    Runs service behind an HTTP server on host:port (or on the Unix socket
+    unix_path) until it gets SIGINT or SIGTERM.
+    """
+    async with service:
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(service.handle_connection,
+                    unix_path)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(service.handle_connection,
+                    host, port)
+            where = "http://%s:%d" % (host, port)
+
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # e.g. on Windows; ctrl-c still stops asyncio.run
+
+        print("Serving collages on %s (output in %s)"
+                % (where, service.get_output_dir()), file=sys.stderr)
+        async with server:
+            await stopping.wait()
+        if unix_path is not None and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+def parse_args(argv=None):
+    """Returns the parsed command line arguments."""
+    parser = argparse.ArgumentParser(
+            description="Serve Andy Warhol-style collages over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1",
+            help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+            help="port to listen on (default: %d)" % DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH",
+            help="listen on this Unix socket instead of a port")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+            help="number of worker processes")
+    parser.add_argument("-q", "--queue-size", type=int,
+            default=DEFAULT_QUEUE_SIZE,
+            help="jobs that may wait for a worker before new ones are turned "
+                    "away (default: %d)" % DEFAULT_QUEUE_SIZE)
+    parser.add_argument("-t", "--timeout", type=float, default=DEFAULT_TIMEOUT,
+            help="longest seconds a job may take, including waiting "
+                    "(default: %g)" % DEFAULT_TIMEOUT)
+    parser.add_argument("-o", "--output-dir",
+            help="directory for collages of jobs that don't give an output "
+                    "(default: a new temporary directory)")
+    parser.add_argument("--backend", choices=("python", "numpy"),
+            help="filter backend (default: numpy if installed)")
+    parser.add_argument("--source-cache", type=int, default=DEFAULT_SOURCE_CACHE,
+            help="decoded pictures each worker keeps (default: %d)"
+                    % DEFAULT_SOURCE_CACHE)
+
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    return args
+
+
+def main(argv=None):
+    """Runs the render service until it is stopped."""
+    args = parse_args(argv)
+    service = RenderService(args.workers, args.queue_size, args.timeout,
+            args.output_dir, args.backend, args.source_cache)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Module: resample
+
+Resizes Pictures to any size.
+
+The following methods are available:
+
+"nearest"  - each new pixel copies one of the original pixels (fast, blocky).
+"area"     - each new pixel is the average of all the original pixels it
+             covers (best for shrinking).
+"bilinear" - blends the 2x2 nearest original pixels.
+"lanczos"  - high quality windowed sinc filter (slowest, sharpest).
+
+The resampling itself is done by PIL, which works directly on the Picture's
+pixel buffer, except that "area" shrinking by less than EXACT_AREA_BELOW
+times (including the last step when shrinking from a picture's pyramid, see
+resize) is done exactly by integral.area_resample instead.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+from PIL import Image
+
+import comp110_image
+import integral
+
+METHODS = {
+    "nearest": Image.NEAREST,
+    "area": Image.BOX,
+    "bilinear": Image.BILINEAR,
+    "lanczos": Image.LANCZOS,
+}
+
+
+# PIL's box filter only samples pixel centers, which is too coarse when
+# shrinking by less than this many times, so "area" is then done by exact
+# area averaging (integral.area_resample) instead. Beyond it PIL is much
+# faster and close enough.
+EXACT_AREA_BELOW = 8
+
+
+def _to_picture(image, title=None):
+    """Returns a new Picture with the pixels of the given RGB PIL Image."""
+    return comp110_image.Picture(image.width, image.height, title=title,
+            data=image.tobytes())
+
+
+def fit_size(width, height, max_w, max_h, enlarge=False):
+    """
+    Returns the largest size with the same aspect ratio as width x height
+    that fits inside max_w x max_h. Raises a ValueError if max_w or max_h is
+    less than 1.
+
+    Parameters:
+    width (type: int) - The original width.
+    height (type: int) - The original height.
+    max_w (type: int) - The maximum width.
+    max_h (type: int) - The maximum height.
+    enlarge (type: bool) - Whether the result may be bigger than the original.
+
+    Returns:
+    (type: tuple) - The (width, height) that fits.
+    """
+    if max_w < 1 or max_h < 1:
+        raise ValueError("the maximum size must be at least 1x1, not %dx%d"
+                % (max_w, max_h))
+    if width <= 0 or height <= 0:
+        return (0, 0)
+
+    scale = min(max_w / width, max_h / height)
+    if not enlarge:
+        scale = min(scale, 1)
+
+    # round down, but never to nothing
+    new_w = max(1, min(max_w, int(width * scale)))
+    new_h = max(1, min(max_h, int(height * scale)))
+    return (new_w, new_h)
+
+
+def subsample(img, factor):
+    """
+    Shrinks img by an integer factor by keeping the top left pixel of every
+    factor x factor block (nearest neighbour).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    factor (type: int) - How many times smaller to make the picture.
+
+    Returns:
+    (type: Picture) - The shrunk picture.
+    """
+    width = img.getWidth() // factor
+    height = img.getHeight() // factor
+    row_size = img.getWidth() * 3
+    step = 3 * factor
+    data = img.getBytes()
+
+    result = bytearray(width * height * 3)
+    for y in range(height):
+        row = data[y * factor * row_size:(y * factor + 1) * row_size]
+        start = y * width * 3
+        end = start + width * 3
+        result[start:end:3] = row[0:width * step:step]
+        result[start + 1:end:3] = row[1:width * step:step]
+        result[start + 2:end:3] = row[2:width * step:step]
+
+    return comp110_image.Picture(width, height, title=img.getTitle(),
+            data=result)
+
+
+def reduce(img, factor):
+    """
+    Shrinks img by an integer factor, averaging each factor x factor block
+    of pixels into one.
+
+    Leftover rows and columns that don't fill a whole block are dropped.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    factor (type: int) - How many times smaller to make the picture.
+
+    Returns:
+    (type: Picture) - The shrunk picture.
+    """
+    width = img.getWidth() // factor
+    height = img.getHeight() // factor
+    if width == 0 or height == 0:
+        return comp110_image.Picture(width, height, title=img.getTitle())
+
+    image = img.getImage()
+    if (width * factor, height * factor) != image.size:
+        image = image.crop((0, 0, width * factor, height * factor))
+
+    return _to_picture(image.reduce(factor), img.getTitle())
+
+
+def _resize_box(img, width, height, method, box):
+    """
+    Returns the (left, top, right, bottom) box of img, in possibly fractional
+    pixels, resized to width x height.
+    """
+    if method == "area":
+        # only ever used for the little shrinking left after a pyramid level
+        # or a reduced-scale decode (see EXACT_AREA_BELOW)
+        return integral.area_resample(img, width, height, box)
+
+    image = img.getImage().resize((width, height), METHODS[method], box=box)
+    return _to_picture(image, img.getTitle())
+
+
+def resize(img, width, height, method="area", pyramid=False):
+    """
+    Returns a copy of img resized to exactly width x height.
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    width (type: int) - The new width.
+    height (type: int) - The new height.
+    method (type: str) - One of "nearest", "area", "bilinear" or "lanczos".
+    pyramid (type: bool) - Whether to shrink from the smallest level of img's
+        pyramid that is still big enough (see Picture.get_pyramid_level)
+        instead of from img itself. The levels are kept with img, so this is
+        much faster when img is shrunk to several sizes. The result may
+        differ a little from shrinking img directly, since each pixel of a
+        level stands for a whole block of pixels of img.
+
+    Returns:
+    (type: Picture) - The resized picture.
+    """
+    if method not in METHODS:
+        raise ValueError("method must be one of %s, not %r"
+                % (tuple(METHODS), method))
+
+    src_w, src_h = img.getWidth(), img.getHeight()
+    if (width, height) == (src_w, src_h):
+        return img.copy()
+    if width == 0 or height == 0 or src_w == 0 or src_h == 0:
+        return comp110_image.Picture(width, height, title=img.getTitle())
+
+    level = img.get_pyramid_level_for(width, height) if pyramid else 0
+    if level > 0:
+        # the last row and column of a level may cover less than 2 ** level
+        # pixels, so resample exactly the part that covers the picture
+        scale = 2 ** level
+        return _resize_box(img.get_pyramid_level(level), width, height,
+                method, (0, 0, src_w / scale, src_h / scale))
+
+    if method == "area":
+        factor = min(src_w // width, src_h // height)
+        if factor >= 2 and (width * factor, height * factor) == (src_w, src_h):
+            # shrinking by a whole number: a plain block average is enough
+            return reduce(img, factor)
+        if min(src_w / width, src_h / height) < EXACT_AREA_BELOW:
+            return integral.area_resample(img, width, height)
+
+    image = img.getImage().resize((width, height), METHODS[method])
+    return _to_picture(image, img.getTitle())
+
+
+def load_fit(filename, max_w, max_h, method="area", enlarge=False):
+    """
+    Loads the picture in a file, resized to the largest size that fits
+    inside max_w x max_h (see fit).
+
+    JPEGs are decoded at a reduced scale first when that is still at least
+    twice as big (see comp110_image.draft_box), so shrinking a big photo never needs the
+    full size picture in memory. For "area", the rest of the way is done by
+    exact area averaging (integral.area_resample), since what is left to
+    shrink after a reduced-scale decode is too little for PIL's box filter.
+
+    Returns:
+    (type: Picture) - The resized picture.
+    """
+    if method not in METHODS:
+        raise ValueError("method must be one of %s, not %r"
+                % (tuple(METHODS), method))
+
+    if comp110_image.is_raw_file(filename):
+        pic = comp110_image.open_raw(filename)
+        width, height = fit_size(pic.getWidth(), pic.getHeight(), max_w, max_h,
+                enlarge)
+        box = (0, 0, pic.getWidth(), pic.getHeight())
+    else:
+        with Image.open(filename) as image:
+            width, height = fit_size(image.width, image.height, max_w, max_h,
+                    enlarge)
+            # the reduced decode is itself only roughly an average, so keep
+            # at least twice the final size for area averaging to finish
+            box = comp110_image.draft_box(image, (2 * width, 2 * height))
+            pic = _to_picture(comp110_image.rgb_image(image))
+
+    if width == 0 or height == 0:
+        return comp110_image.Picture(width, height)
+    return _resize_box(pic, width, height, method, box)
+
+
+def fit(img, max_w, max_h, method="area", enlarge=False, pyramid=False):
+    """
+    Returns a copy of img resized to the largest size that fits inside
+    max_w x max_h without changing its aspect ratio (see fit_size and, for
+    pyramid, resize).
+    """
+    width, height = fit_size(img.getWidth(), img.getHeight(), max_w, max_h,
+            enlarge)
+    return resize(img, width, height, method, pyramid)
@@ -0,0 +1,538 @@
+"""
+Module: tiled_collage
+
+Creates a collage a strip of rows at a time, so that the full size source
+picture never has to be held in memory as a Picture.
+
+Each stage of the collage_creator pipeline (load, shrink, filter, assemble)
+is a "row source": an object that knows its width and height and can produce
+any range of its rows on request. Stages only ask the stage before them for
+the rows they need (plus a few extra "halo" rows for convolution), and the
+finished collage is written out strip by strip.
+
+Only raw pictures (see comp110_image.open_raw) and uncompressed files with
+plain RGB rows (e.g. PPM) are really read a strip at a time, so only for
+them does peak memory depend on the strip height rather than on the size of
+the source picture. Compressed formats are decoded whole up front, JPEGs at
+a reduced scale (see ImageFileSource).
+
+The picture is shrunk by exact area averaging from the same decode as
+resample.load_fit, so the collage is the same as
+collage_creator.create_collage(resample.load_fit(...)).
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import collections
+import os
+
+from PIL import Image
+
+import collage_creator
+import comp110_image
+import convolution_engine
+import integral
+import resample
+
+# Number of rows processed at a time when none is given.
+DEFAULT_STRIP_HEIGHT = 64
+
+
+class RowSource:
+    """
+    Base class for a picture that is produced a strip of rows at a time.
+
+    Subclasses must implement read_rows.
+    """
+
+    def __init__(self, width, height, title=None):
+        self.__width = width
+        self.__height = height
+        self.__title = title
+
+    def get_width(self):
+        return self.__width
+
+    def get_height(self):
+        return self.__height
+
+    def get_title(self):
+        return self.__title
+
+    def read_rows(self, start, stop):
+        """
+        Returns rows start (inclusive) to stop (exclusive) as a Picture that is
+        get_width() wide and (stop - start) high.
+        """
+        raise NotImplementedError
+
+    def read_row_list(self, rows):
+        """
+        Returns a Picture made of the given rows (a list of row numbers, which
+        may repeat or be out of order), one after another.
+
+        The rows from the first to the last one asked for are read in one go
+        when there aren't many more of them than were asked for (e.g. rows
+        that run backwards, as in a mirror image). Otherwise each run of
+        consecutive rows is read on its own.
+        """
+        row_size = self.__width * 3
+        if rows and max(rows) - min(rows) < 2 * len(rows):
+            first = min(rows)
+            data = self.read_rows(first, max(rows) + 1).getBytes()
+            return comp110_image.Picture(self.__width, len(rows),
+                    title=self.__title, data=b"".join(
+                        data[(y - first) * row_size:(y - first + 1) * row_size]
+                        for y in rows))
+
+        chunks = []
+        i = 0
+        while i < len(rows):
+            # read runs of consecutive rows with a single call
+            j = i + 1
+            while j < len(rows) and rows[j] == rows[j - 1] + 1:
+                j += 1
+            strip = self.read_rows(rows[i], rows[j - 1] + 1)
+            chunks.append(strip.getBytes()[:(j - i) * row_size])
+            i = j
+
+        return comp110_image.Picture(self.__width, len(rows), title=self.__title,
+                data=b"".join(chunks))
+
+    def to_picture(self):
+        """Returns the whole source as a single Picture."""
+        return self.read_rows(0, self.__height)
+
+    # camelCase alternative names
+    getWidth = get_width
+    getHeight = get_height
+    getTitle = get_title
+    readRows = read_rows
+    toPicture = to_picture
+
+
+def crop_rows(pic, start, stop):
+    """Returns a view of rows start to stop of the given picture."""
+    return pic.getView(0, start, pic.getWidth(), stop - start)
+
+
+def _check_rows(source, start, stop):
+    """Raises an IndexError if start to stop is not a valid range of rows."""
+    if not 0 <= start <= stop <= source.get_height():
+        raise IndexError("rows %d to %d are outside of the picture" % (start, stop))
+
+
+class PictureSource(RowSource):
+    """A row source for a Picture that is already in memory."""
+
+    def __init__(self, pic):
+        RowSource.__init__(self, pic.getWidth(), pic.getHeight(), pic.getTitle())
+        self.__pic = pic
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        return crop_rows(self.__pic, start, stop)
+
+
+class ImageFileSource(RowSource):
+    """
+    A row source that reads an image file.
+
+    Raw pictures (see comp110_image.open_raw) are memory mapped, and each
+    strip is a view of the mapped file. Other uncompressed files with plain
+    RGB rows (e.g. PPM and most TIFFs) are read directly from disk a strip at
+    a time. Only these two kinds really stream.
+
+    Other formats are decoded by PIL up front, which keeps the image in PIL's
+    compact format (3 bytes a pixel) rather than as a Picture. If draft_size
+    is given, JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale as long as
+    they are still at least that big (see comp110_image.draft_box), which
+    uses much less memory when the picture is going to be shrunk anyway.
+    """
+
+    def __init__(self, filename, title=None, draft_size=None):
+        self.__file = None
+        self.__image = None
+        self.__picture = None
+
+        if comp110_image.is_raw_file(filename):
+            self.__picture = comp110_image.open_raw(filename, title)
+            RowSource.__init__(self, self.__picture.getWidth(),
+                    self.__picture.getHeight(), title)
+            self.__box = (0, 0, self.get_width(), self.get_height())
+            return
+
+        image = Image.open(filename)
+        if draft_size is not None:
+            self.__box = comp110_image.draft_box(image, draft_size)
+        else:
+            self.__box = (0, 0, image.width, image.height)
+        RowSource.__init__(self, image.width, image.height, title)
+        self.__offset = self.__raw_offset(image)
+
+        if self.__offset is not None:
+            self.__file = open(filename, "rb")
+            image.close()
+        else:
+            self.__image = comp110_image.rgb_image(image)
+            self.__image.load()
+
+    def get_box(self):
+        """
+        Returns the (left, top, right, bottom) part of this source, in
+        (possibly fractional) pixels, that covers the picture in the file.
+        This is all of it unless the file was decoded at a reduced scale.
+        """
+        return self.__box
+
+    def __raw_offset(self, image):
+        """
+        Returns file offset of the first row if image is stored as plain,
+        top-down RGB rows, or None otherwise.
+        """
+        if image.mode != "RGB" or len(image.tile) != 1:
+            return None
+
+        decoder, extents, offset, args = image.tile[0]
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+
+        if decoder != "raw" or rawmode != "RGB" or orientation != 1 \
+                or tuple(extents) != (0, 0, image.width, image.height) \
+                or stride not in (0, image.width * 3):
+            return None
+
+        return offset
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        width = self.get_width()
+
+        if self.__picture is not None:
+            return crop_rows(self.__picture, start, stop)
+        if self.__file is not None:
+            row_size = width * 3
+            self.__file.seek(self.__offset + start * row_size)
+            data = self.__file.read((stop - start) * row_size)
+        else:
+            data = self.__image.crop((0, start, width, stop)).tobytes()
+
+        return comp110_image.Picture(width, stop - start, title=self.get_title(),
+                data=data)
+
+    def close(self):
+        """Releases the file (or decoded image) held by this source."""
+        if self.__file is not None:
+            self.__file.close()
+        if self.__image is not None:
+            self.__image.close()
+        self.__picture = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AreaShrinkSource(RowSource):
+    """
+    A row source that resizes the (left, top, right, bottom) box of another
+    source to width x height by exact area averaging (the same as
+    integral.area_resample, which gives exactly the same result a strip at
+    a time).
+    """
+
+    def __init__(self, source, width, height, box=None, backend=None):
+        RowSource.__init__(self, width, height, source.getTitle())
+        if box is None:
+            box = (0, 0, source.getWidth(), source.getHeight())
+        left, top, right, bottom = box
+        self.__source = source
+        self.__xs = integral.area_edges(left, right, width)
+        self.__ys = integral.area_edges(top, bottom, height)
+        self.__backend = backend
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        ys = self.__ys
+        # the source rows that the edges of these rows fall in
+        first = int(ys[start])
+        last = min(self.__source.getHeight(), int(ys[stop]) + 1)
+        strip = self.__source.read_rows(first, last)
+        return integral.area_resample_edges(strip, self.__xs,
+                [y - first for y in ys[start:stop + 1]], self.__backend)
+
+
+class StripCacheSource(RowSource):
+    """
+    A row source that keeps the last few strips it read from another source,
+    so that several stages reading the same rows (like the six filters of a
+    collage, see filtered_sources) only make each strip once.
+
+    The strips are strip_height rows each, starting at row 0, and at most
+    max_strips of them are kept (all of them if None).
+    """
+
+    def __init__(self, source, strip_height=DEFAULT_STRIP_HEIGHT,
+            max_strips=None):
+        RowSource.__init__(self, source.getWidth(), source.getHeight(),
+                source.getTitle())
+        self.__source = source
+        self.__strip_height = strip_height
+        self.__max_strips = max_strips
+        self.__strips = collections.OrderedDict()
+
+    def __strip(self, i):
+        """Returns strip i, reading it from the source if it isn't kept."""
+        if i in self.__strips:
+            self.__strips.move_to_end(i)
+            return self.__strips[i]
+
+        h = self.__strip_height
+        strip = self.__source.read_rows(i * h,
+                min(self.get_height(), (i + 1) * h))
+        self.__strips[i] = strip
+        if self.__max_strips is not None \
+                and len(self.__strips) > self.__max_strips:
+            self.__strips.popitem(last=False)
+        return strip
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        h = self.__strip_height
+        if start == stop:
+            return comp110_image.Picture(self.get_width(), 0,
+                    title=self.get_title())
+
+        first, last = start // h, (stop - 1) // h
+        if first == last:
+            strip = self.__strip(first)
+        else:
+            strips = [self.__strip(i) for i in range(first, last + 1)]
+            strip = comp110_image.Picture(self.get_width(),
+                    sum(s.getHeight() for s in strips), title=self.get_title(),
+                    data=b"".join(s.getBytes() for s in strips))
+
+        # a copy, so that a stage changing its rows doesn't change the kept
+        # strip (copies of whole strips share their pixels until changed)
+        return crop_rows(strip, start - first * h, stop - first * h).copy()
+
+
+class RowFilterSource(RowSource):
+    """
+    A row source that applies a filter which only looks at one row at a time
+    (like unique_filter, gray_filter and mirror_filter) to another source.
+    """
+
+    def __init__(self, source, row_filter):
+        RowSource.__init__(self, source.getWidth(), source.getHeight(),
+                source.getTitle())
+        self.__source = source
+        self.__filter = row_filter
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        return self.__filter(self.__source.read_rows(start, stop))
+
+
+class FlipSource(RowSource):
+    """A row source that is another source flipped upside down."""
+
+    def __init__(self, source, backend=None):
+        RowSource.__init__(self, source.getWidth(), source.getHeight(),
+                source.getTitle())
+        self.__source = source
+        self.__backend = backend
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        h = self.get_height()
+        strip = self.__source.read_rows(h - stop, h - start)
+        return collage_creator.flip_filter(strip, self.__backend)
+
+
+class MirrorSource(RowSource):
+    """
+    A row source whose bottom half is the mirror image of the top half of
+    another source (like collage_creator.mirror_x).
+    """
+
+    def __init__(self, source):
+        RowSource.__init__(self, source.getWidth(), source.getHeight(),
+                source.getTitle())
+        self.__source = source
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        h = self.get_height()
+        keep = h - h // 2
+        rows = [y if y < keep else h - 1 - y for y in range(start, stop)]
+        return self.__source.read_row_list(rows)
+
+
+class ConvolutionSource(RowSource):
+    """
+    A row source that applies a convolution kernel to another source.
+
+    Each strip is read with enough extra rows above and below it (the "halo")
+    for the kernel to see all of its neighbours, so the result is the same as
+    convolving the whole picture at once.
+    """
+
+    def __init__(self, source, kernel, border="skip", backend=None):
+        convolution_engine.check_kernel(kernel)
+        RowSource.__init__(self, source.getWidth(), source.getHeight(),
+                source.getTitle())
+        self.__source = source
+        self.__kernel = kernel
+        self.__border = border
+        self.__backend = backend
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        h = self.get_height()
+        radius = len(self.__kernel) // 2
+
+        if self.__border == "skip":
+            # only rows that exist can be used; the picture's own top and
+            # bottom rows are left alone by the convolution itself
+            first = max(0, start - radius)
+            rows = list(range(first, min(h, stop + radius)))
+        else:
+            first = start - radius
+            padded = convolution_engine.padded_indices(h, radius, self.__border)
+            rows = padded[start:stop + 2 * radius]
+
+        strip = self.__source.read_row_list(rows)
+        filtered = convolution_engine.convolve(strip, self.__kernel,
+                self.__border, backend=self.__backend)
+        return crop_rows(filtered, start - first, stop - first)
+
+
+class CollageSource(RowSource):
+    """
+    A row source that places six equally sized sources in a 3x2 grid, in the
+    same arrangement as collage_creator.assemble_collage.
+    """
+
+    def __init__(self, sources):
+        w = sources[0].getWidth()
+        h = sources[0].getHeight()
+        RowSource.__init__(self, w * 3, h * 2)
+
+        # the order in which assemble_collage places the pictures
+        self.__grid = ((sources[0], sources[1], sources[2]),
+                (sources[4], sources[3], sources[5]))
+        self.__tile_height = h
+
+    def read_rows(self, start, stop):
+        _check_rows(self, start, stop)
+        h = self.__tile_height
+
+        chunks = []
+        for grid_row in range(2):
+            lo = max(start, grid_row * h) - grid_row * h
+            hi = min(stop, (grid_row + 1) * h) - grid_row * h
+            if lo >= hi:
+                continue
+
+            tiles = [s.read_rows(lo, hi).getBytes() for s in self.__grid[grid_row]]
+            row_size = len(tiles[0]) // (hi - lo)
+            for y in range(hi - lo):
+                for tile in tiles:
+                    chunks.append(tile[y * row_size:(y + 1) * row_size])
+
+        return comp110_image.Picture(self.get_width(), stop - start,
+                data=b"".join(chunks))
+
+
+def filtered_sources(source, backend=None,
+        strip_height=DEFAULT_STRIP_HEIGHT):
+    """
+    Returns the six row sources made by applying the collage filters to
+    source, in the same order as collage_creator.create_filtered_pics.
+
+    The six share the strips they read from source (see StripCacheSource),
+    so each strip of source is only made once. The flipped and mirrored
+    copies read it from the bottom up while the others read it from the top
+    down, so every strip is kept; source is one tile of the collage, so that
+    is at most a sixth of the collage's size (and nothing like the size of
+    the picture it was shrunk from).
+    """
+    source = StripCacheSource(source, strip_height)
+    return (RowFilterSource(source,
+                lambda strip: collage_creator.unique_filter(strip, backend)),
+            ConvolutionSource(source, collage_creator.EDGE_KERNEL, backend=backend),
+            FlipSource(source, backend),
+            RowFilterSource(source,
+                lambda strip: collage_creator.mirror_filter(strip, backend)),
+            MirrorSource(source),
+            RowFilterSource(source,
+                lambda strip: collage_creator.gray_filter(strip, backend)))
+
+
+def image_size(filename):
+    """Returns the (width, height) of the picture in a file without decoding."""
+    if comp110_image.is_raw_file(filename):
+        pic = comp110_image.open_raw(filename)
+        return (pic.getWidth(), pic.getHeight())
+
+    with Image.open(filename) as image:
+        return image.size
+
+
+def save_rows(source, filename, strip_height=DEFAULT_STRIP_HEIGHT):
+    """
+    Saves a row source to a file, one strip at a time.
+
+    PPM files are written to disk as each strip is finished. For other formats
+    the strips are collected in a PIL image (3 bytes a pixel) and then encoded,
+    since PIL can only encode whole images.
+    """
+    width, height = source.getWidth(), source.getHeight()
+
+    if os.fspath(filename).lower().endswith(".ppm"):
+        with open(filename, "wb") as f:
+            f.write(b"P6\n%d %d\n255\n" % (width, height))
+            for start in range(0, height, strip_height):
+                stop = min(height, start + strip_height)
+                f.write(source.read_rows(start, stop).getBytes())
+        return
+
+    image = Image.new("RGB", (width, height))
+    for start in range(0, height, strip_height):
+        stop = min(height, start + strip_height)
+        image.paste(source.read_rows(start, stop).getImage(), (0, start))
+    image.save(filename)
+
+
+def create_collage(image_filename, collage_filename, max_w, max_h,
+        strip_height=DEFAULT_STRIP_HEIGHT, backend=None):
+    """
+    Creates a collage from an image file and saves it, without ever loading
+    the full image as a Picture.
+
+    Parameters:
+    image_filename (type: str) - The picture to make a collage of.
+    collage_filename (type: str) - Where to save the collage.
+    max_w (type: int) - The maximum width of the collage.
+    max_h (type: int) - The maximum height of the collage.
+    strip_height (type: int) - How many rows to process at a time.
+    backend (type: str) - "python" or "numpy" (see filter_engine).
+    """
+    tile_w, tile_h = resample.fit_size(*image_size(image_filename),
+            max_w // 3, max_h // 2)
+    # decoded the same way as resample.load_fit
+    with ImageFileSource(image_filename,
+            draft_size=(2 * tile_w, 2 * tile_h)) as source:
+        shrunk = AreaShrinkSource(source, tile_w, tile_h, source.get_box(),
+                backend)
+        collage = CollageSource(filtered_sources(shrunk, backend,
+                strip_height))
+        save_rows(collage, collage_filename, strip_height)
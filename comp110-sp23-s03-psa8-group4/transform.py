@@ -0,0 +1,140 @@
+"""
+Module: transform
+
+Geometric transforms of Pictures: flips, transposing and rotating by
+multiples of 90 degrees.
+
+None of these change any colors, they only move pixels around, so they are
+done with whole-row or whole-column slice copies (or NumPy array copies)
+instead of pixel by pixel. Where the result can simply be a different way
+of looking at the same pixels (flipped_view, rotating by 0 degrees) nothing
+is copied at all.
+
+Authors:
+1) Will Dobrzanski - USD Email Address
+2) Antonio Barcelos - USD Email Address
+"""
+
+import filter_engine
+from filter_engine import numpy
+
+
+def flip_vertical(img, backend=None, out=None):
+    """Returns a copy of img flipped upside down (see filter_engine)."""
+    return filter_engine.flip_vertical(img, backend, out)
+
+
+def flip_horizontal(img, backend=None, out=None):
+    """Returns a copy of img flipped left to right (see filter_engine)."""
+    return filter_engine.flip_horizontal(img, backend, out)
+
+
+def flipped_view(img):
+    """
+    Returns img upside down without copying any pixels (see
+    Picture.get_flipped_view). Changing the view changes img.
+    """
+    return img.getFlippedView()
+
+
+def _columns(data, width, height, right_to_left=False, bottom_to_top=False):
+    """
+    Returns the columns of the RGB bytes in data as the rows of a new
+    picture.
+
+    Parameters:
+    data (type: bytes) - The pixels of a width x height picture.
+    width (type: int) - The width of the picture.
+    height (type: int) - The height of the picture.
+    right_to_left (type: bool) - Whether the right-most column becomes the
+        first row (otherwise the left-most one does).
+    bottom_to_top (type: bool) - Whether each column is read bottom to top.
+
+    Returns:
+    (type: bytearray) - The pixels of the height x width result.
+    """
+    row_size = width * 3
+    out_row = height * 3
+    result = bytearray(len(data))
+    for i in range(width):
+        x = width - 1 - i if right_to_left else i
+        start = i * out_row
+        end = start + out_row
+        for c in range(3):
+            column = data[x * 3 + c::row_size]
+            result[start + c:end:3] = column[::-1] if bottom_to_top else column
+    return result
+
+
+def transpose(img, backend=None, out=None):
+    """
+    Returns a copy of img with its rows and columns swapped, so pixel (x, y)
+    moves to (y, x) (i.e. the picture is flipped over its top left to bottom
+    right diagonal).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result, which must be
+        height x width (a new picture is made if None).
+
+    Returns:
+    (type: Picture) - The transposed picture.
+    """
+    width, height = img.getWidth(), img.getHeight()
+    if filter_engine.get_backend(backend) == "numpy":
+        arr = filter_engine.to_array(img).transpose(1, 0, 2)
+        return filter_engine.from_array(arr, img.getTitle(), out)
+
+    data = _columns(img.getBytes(), width, height)
+    return filter_engine.make_result(img, data, out, (height, width))
+
+
+def rotate(img, angle, backend=None, out=None):
+    """
+    Returns a copy of img rotated counter-clockwise by angle degrees (like
+    PIL's Image.rotate).
+
+    Parameters:
+    img (type: Picture) - The original picture.
+    angle (type: int) - 0, 90, 180 or 270 (or any multiple of 90, e.g. -90
+        for clockwise).
+    backend (type: str or None) - "python" or "numpy" (see filter_engine).
+    out (type: Picture or None) - Where to write the result, which must be
+        the rotated size (a new picture is made if None).
+
+    Returns:
+    (type: Picture) - The rotated picture.
+    """
+    if angle % 90 != 0:
+        raise ValueError("angle must be a multiple of 90, not %r" % (angle,))
+    angle %= 360
+
+    width, height = img.getWidth(), img.getHeight()
+
+    if angle == 0:
+        if out is None:
+            # copies share their pixels until changed, so this is free
+            return img.copy()
+        return filter_engine.make_result(img, img.getBytes(), out)
+
+    if filter_engine.get_backend(backend) == "numpy":
+        arr = numpy.rot90(filter_engine.to_array(img), angle // 90)
+        return filter_engine.from_array(arr, img.getTitle(), out)
+
+    data = img.getBytes()
+    if angle == 180:
+        # reversing the pixels' order turns the picture upside down and
+        # left to right at the same time
+        result = bytearray(len(data))
+        for c in range(3):
+            result[c::3] = data[c::3][::-1]
+        return filter_engine.make_result(img, result, out)
+
+    if angle == 90:
+        # the right-most column becomes the top row
+        result = _columns(data, width, height, right_to_left=True)
+    else:
+        # the left-most column, read bottom to top, becomes the top row
+        result = _columns(data, width, height, bottom_to_top=True)
+    return filter_engine.make_result(img, result, out, (height, width))